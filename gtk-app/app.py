@@ -1,9 +1,50 @@
 #!/usr/bin/env python3
-import gi, subprocess, time, sys, os, configparser, json
+import gi, subprocess, time, sys, os, configparser, json, collections, itertools, tempfile, glob, threading
+STARTED = time.time()
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 gi.require_version("Gtk", "3.0")
 gi.require_version("Wnck", "3.0")
 gi.require_version("GdkX11", "3.0")
-from gi.repository import Gtk, GdkPixbuf, Gdk, Wnck, GdkX11
+# Wnck is imported when the window list is first built, after the window is on screen.
+from gi.repository import Gtk, GdkPixbuf, Gdk, GdkX11, GLib
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+from common import encode, rawimage, trace
+from common.worker import ScriptPool, has_entry_point
+from jobs import JobQueue
+
+# Parsed config files by path, reused while their mtime and size are unchanged.
+_file_cache = {}
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def cached_parse(path, parse):
+    signature = file_signature(path)
+    cached = _file_cache.get(path)
+    if signature is not None and cached is not None and cached[0] == signature:
+        return cached[1]
+    value = parse(path)
+    _file_cache[path] = (signature, value)
+    return value
+
+def read_ini(path):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+def read_json(path):
+    with open(path, "r") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {"scripts": []}
 
 def load_config():
     config = configparser.ConfigParser()
@@ -14,7 +55,7 @@ def load_config():
         config_file = os.path.join(home, ".config", "smartscreenshot", "smartscreenshot.ini")
     os.makedirs(os.path.dirname(config_file), exist_ok=True)
     if os.path.exists(config_file):
-        config.read(config_file)
+        config = cached_parse(config_file, read_ini)
     else:
         config["General"] = {
             "override_width": "",
@@ -25,18 +66,51 @@ def load_config():
             "global_preview_scale_fraction": "0.5",
             "container_border": "2",
             "capture_delay": "0.5",
+            "capture_settle": "0.05",
+            "hide_for_window_capture": "auto",
+            "script_workers": "1",
+            "job_threads": "2",
+            "preview_high_quality": "true",
             "scripts_config": os.path.join(os.path.expanduser("~"), ".config", "smartscreenshot", "scripts.json")
         }
+        config["Output"] = {
+            "final_format": "png",
+            "final_compression": "9",
+            "temp_format": "png",
+            "temp_compression": "1"
+        }
+        config["Trace"] = {
+            "file": "",
+            "format": "jsonl"
+        }
         with open(config_file, "w") as f:
             config.write(f)
     if "container_border" not in config["General"]:
         config["General"]["container_border"] = "2"
     if "capture_delay" not in config["General"]:
         config["General"]["capture_delay"] = "0.5"
+    if "capture_settle" not in config["General"]:
+        config["General"]["capture_settle"] = "0.05"
+    if "hide_for_window_capture" not in config["General"]:
+        config["General"]["hide_for_window_capture"] = "auto"
+    if "script_workers" not in config["General"]:
+        config["General"]["script_workers"] = "1"
+    if "job_threads" not in config["General"]:
+        config["General"]["job_threads"] = "2"
+    if "preview_high_quality" not in config["General"]:
+        config["General"]["preview_high_quality"] = "true"
     if "image_viewer" not in config["General"]:
         config["General"]["image_viewer"] = "xdg-open" 
     if "scripts_config" not in config["General"]:
         config["General"]["scripts_config"] = os.path.join(os.path.expanduser("~"), ".config", "smartscreenshot", "scripts.json")
+    if "Output" not in config:
+        config["Output"] = {}
+    for key, value in (("final_format", "png"), ("final_compression", "9"),
+                       ("temp_format", "png"), ("temp_compression", "1")):
+        if key not in config["Output"]:
+            config["Output"][key] = value
+    if "Trace" not in config:
+        config["Trace"] = {"file": "", "format": "jsonl"}
     return config, config_file
 
 def load_scripts_config(config):
@@ -58,21 +132,40 @@ def load_scripts_config(config):
             json.dump(default_scripts, f, indent=4)
         return default_scripts
     else:
-        with open(scripts_path, "r") as f:
-            try:
-                scripts_conf = json.load(f)
-            except json.JSONDecodeError:
-                scripts_conf = {"scripts": []}
-        return scripts_conf
+        return cached_parse(scripts_path, read_json)
+
+def pixbuf_to_raw(pixbuf, path):
+    rawimage.write_bytes(path, pixbuf.read_pixel_bytes().get_data(), pixbuf.get_width(), pixbuf.get_height(),
+                         pixbuf.get_rowstride(), pixbuf.get_n_channels())
+
+def pixbuf_from_raw(path):
+    header, data = rawimage.read_bytes(path)
+    return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB, header["channels"] == 4, 8,
+                                           header["width"], header["height"], header["stride"])
+
+def pixbuf_from_file(path):
+    """Loads an image file; WebP goes through OpenCV, since most systems have no WebP pixbuf loader."""
+    if not path.lower().endswith(".webp"):
+        return GdkPixbuf.Pixbuf.new_from_file(path)
+    import cv2
+    image = rawimage.imread(path)
+    if image is None:
+        raise OSError(f"could not read '{path}'")
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    height, width = rgb.shape[:2]
+    return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(rgb.tobytes()), GdkPixbuf.Colorspace.RGB, False, 8,
+                                           width, height, width * 3)
 
 class ScreenshotApp(Gtk.Window):
     def __init__(self):
         super().__init__(title="Screenshot App")
         self.set_default_size(1000, 700)
 
+        # Time since launch at each startup step, printed once the window list is ready.
+        self.startup_marks = []
         self.config, self.config_file = load_config()
         print(f"Using config file: {self.config_file}")
-        self.scripts_conf = load_scripts_config(self.config)
+        self.mark_startup("config")
 
         display = Gdk.Display.get_default()
         monitor = display.get_primary_monitor()
@@ -120,10 +213,64 @@ class ScreenshotApp(Gtk.Window):
         except ValueError:
             self.capture_delay = 0.5
 
+        try:
+            self.capture_settle = float(self.config["General"].get("capture_settle", "0.05"))
+        except ValueError:
+            self.capture_settle = 0.05
+        self.hide_for_window_capture = self.config["General"].get("hide_for_window_capture", "auto").strip().lower()
+
+        # Encoding per purpose; scripts read the same [Output] section through this variable.
+        self.output_settings = encode.load_settings(self.config)
+        os.environ[encode.CONFIG_ENV] = os.path.abspath(self.config_file)
+        # Timing spans; exported to the environment so workers and scripts trace to the same file.
+        trace.configure(*trace.load_settings(self.config))
+        if trace.enabled():
+            print(f"Writing trace to: {trace.get_settings()[0]}")
+
+        try:
+            self.script_workers = int(self.config["General"].get("script_workers", "1"))
+        except ValueError:
+            self.script_workers = 1
+        self.script_pool = ScriptPool(self.script_workers) if self.script_workers > 0 else None
+
+        try:
+            self.job_threads = int(self.config["General"].get("job_threads", "2"))
+        except ValueError:
+            self.job_threads = 2
+        self.jobs = JobQueue(self.job_threads, on_update=self.on_job_update)
+        self.job_rows = {}
+        self.capture_pending = False
+        self.capture_started = 0.0
+        # Capture waiting for the window to unmap: (callback, args), plus the fallback timeout.
+        self.pending_capture = None
+        self.capture_timeout_id = None
+        self.connect("unmap-event", self.on_unmap_event)
+
+        # Window thumbnails are grabbed lazily, one per idle iteration, and scaled on this thread.
+        self.thumb_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smartscreenshot-thumb")
+        self.pending_thumbnails = []
+        self.thumbnail_idle_id = None
+        # Cards and scaled thumbnails by XID; a thumbnail is reused while the window size is unchanged.
+        self.window_cards = {}
+        self.thumbnail_cache = {}
+        self.tracked_windows = set()
+
+        try:
+            self.preview_high_quality = self.config["General"].getboolean("preview_high_quality", True)
+        except ValueError:
+            self.preview_high_quality = True
+        # Scaled previews and encoded viewer files for the most recent images, keyed by pixbuf.
+        self.preview_cache = collections.OrderedDict()
+        self.preview_cache_size = 4
+        self.preview_serials = itertools.count(1)
+        # Viewer files are unredacted captures too; keep them where only this user can read them.
+        self.preview_dir = tempfile.mkdtemp(prefix="smartscreenshot-preview-")
+
         self.set_default_size(self.screen_width // 2, self.screen_height // 2)
 
         self.last_pixbuf = None
         self.last_capture_name = "None"
+        self.processed_pixbuf = None
 
         notebook = Gtk.Notebook()
         self.add(notebook)
@@ -152,10 +299,11 @@ class ScreenshotApp(Gtk.Window):
         upload_btn.connect("clicked", self.on_upload_image)
         button_box.pack_start(upload_btn, False, False, 0)
 
-        scrolled_list = Gtk.ScrolledWindow()
-        scrolled_list.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
-        scrolled_list.set_min_content_height(self.screen_height // 2)
-        window_box.pack_start(scrolled_list, True, True, 0)
+        self.scrolled_list = Gtk.ScrolledWindow()
+        self.scrolled_list.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        self.scrolled_list.set_min_content_height(self.screen_height // 2)
+        self.scrolled_list.get_vadjustment().connect("value-changed", self.schedule_thumbnails)
+        window_box.pack_start(self.scrolled_list, True, True, 0)
 
         self.flowbox = Gtk.FlowBox()
         self.flowbox.set_valign(Gtk.Align.START)
@@ -163,8 +311,10 @@ class ScreenshotApp(Gtk.Window):
         self.flowbox.set_selection_mode(Gtk.SelectionMode.NONE)
         self.flowbox.set_row_spacing(10)
         self.flowbox.set_column_spacing(10)
-        scrolled_list.add(self.flowbox)
-        self.populate_window_list()
+        self.flowbox.connect("size-allocate", self.schedule_thumbnails)
+        self.scrolled_list.add(self.flowbox)
+        # Windows are enumerated after the first frame is drawn (see on_first_draw).
+        self.wnck_screen = None
 
         notebook.append_page(window_frame, Gtk.Label(label="Window Capture"))
 
@@ -186,28 +336,24 @@ class ScreenshotApp(Gtk.Window):
         script_top_box.pack_start(scrolled_scripts, True, True, 0)
         preview_proc_btn = Gtk.Button(label="Preview Processed Image")
         preview_proc_btn.connect("clicked", self.on_preview_processed)
-        script_top_box.pack_start(preview_proc_btn, False, False, 0)
+        save_proc_btn = Gtk.Button(label="Save Processed Image")
+        save_proc_btn.connect("clicked", self.on_save_processed)
+        processed_btn_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        processed_btn_box.pack_start(preview_proc_btn, True, True, 0)
+        processed_btn_box.pack_start(save_proc_btn, True, True, 0)
+        script_top_box.pack_start(processed_btn_box, False, False, 0)
+
+        jobs_frame = Gtk.Frame(label="Jobs")
+        jobs_frame.set_shadow_type(Gtk.ShadowType.IN)
+        self.job_list = Gtk.ListBox()
+        self.job_list.set_selection_mode(Gtk.SelectionMode.NONE)
+        self.job_list.set_placeholder(Gtk.Label(label="No running jobs"))
+        jobs_frame.add(self.job_list)
+        script_top_box.pack_start(jobs_frame, False, False, 0)
         script_paned.pack1(script_top_box, True, False)
 
-        # Load script sections from the external JSON config.
-        scripts = self.scripts_conf.get("scripts", [])
-        if not scripts:
-            scripts = [{
-                "name": "Generic Script",
-                "path": "process_image.py",
-                "parameters": [{"label": "Custom Parameter", "default": "1.0"}]
-            }]
-        for script in scripts:
-            name = script.get("name", "Unnamed Script")
-            path = script.get("path", "")
-            params_list = script.get("parameters", [])
-            parameters = []
-            for param in params_list:
-                label = param.get("label", "Param")
-                default = param.get("default", "")
-                parameters.append((label, default))
-            section = self.create_script_section(script_title=name, script_name=path, parameters=parameters)
-            self.script_flow.add(section)
+        # Script sections are built on the first visit to the tab, and rebuilt when scripts.json changes.
+        self.scripts_signature = None
 
         preview_scrolled = Gtk.ScrolledWindow()
         preview_scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
@@ -227,9 +373,79 @@ class ScreenshotApp(Gtk.Window):
         preview_box.pack_start(self.global_preview, True, True, 0)
         script_paned.pack2(preview_scrolled, False, False)
         notebook.append_page(script_paned, Gtk.Label(label="Scripts"))
+        self.scripts_page = script_paned
+        notebook.connect("switch-page", self.on_switch_page)
 
+        self.first_draw_id = self.connect_after("draw", self.on_first_draw)
+        self.mark_startup("widgets")
         self.show_all()
 
+    def mark_startup(self, step):
+        now = time.time()
+        start = self.startup_marks[-1][1] if self.startup_marks else STARTED
+        trace.record(f"startup_{step.replace(' ', '_')}", start, now - start)
+        self.startup_marks.append((step, now))
+
+    def on_first_draw(self, widget, cr):
+        self.disconnect(self.first_draw_id)
+        self.mark_startup("first frame")
+        GLib.idle_add(self.finish_startup)
+        return False
+
+    def finish_startup(self):
+        from gi.repository import Wnck
+        self.wnck_screen = Wnck.Screen.get_default()
+        self.wnck_screen.connect("window-opened", self.on_wnck_window_opened)
+        self.wnck_screen.connect("window-closed", self.on_wnck_window_closed)
+        self.wnck_screen.connect("window-stacking-changed", self.on_wnck_stacking_changed)
+        self.populate_window_list()
+        self.mark_startup("window list")
+        # Import scripts with a process() entry point in the workers ahead of the first run.
+        if self.script_pool:
+            scripts = self.get_scripts()
+            self.script_pool.warm([s.get("path", "") for s in scripts if has_entry_point(s.get("path", ""))])
+        report = ", ".join(f"{step} {1000 * (t - STARTED):.0f} ms" for step, t in self.startup_marks)
+        print(f"Startup (since launch): {report}")
+        return False
+
+    def get_scripts(self):
+        scripts = load_scripts_config(self.config).get("scripts", [])
+        if not scripts:
+            scripts = [{
+                "name": "Generic Script",
+                "path": "process_image.py",
+                "parameters": [{"label": "Custom Parameter", "default": "1.0"}]
+            }]
+        return scripts
+
+    def on_switch_page(self, notebook, page, page_num):
+        if page is self.scripts_page:
+            self.load_script_sections()
+
+    def load_script_sections(self):
+        """Builds the script sections from the external JSON config, unless it is unchanged since the last build."""
+        started = time.time()
+        scripts = self.get_scripts()
+        signature = file_signature(self.config["General"].get("scripts_config"))
+        if self.scripts_signature is not None and signature == self.scripts_signature:
+            return
+        self.scripts_signature = signature
+        for child in self.script_flow.get_children():
+            self.script_flow.remove(child)
+        for script in scripts:
+            name = script.get("name", "Unnamed Script")
+            path = script.get("path", "")
+            params_list = script.get("parameters", [])
+            parameters = []
+            for param in params_list:
+                label = param.get("label", "Param")
+                default = param.get("default", "")
+                parameters.append((label, default))
+            section = self.create_script_section(script_title=name, script_name=path, parameters=parameters)
+            self.script_flow.add(section)
+        self.script_flow.show_all()
+        trace.record("scripts_tab", started, time.time() - started)
+
     def on_script_paned_allocate(self, widget, allocation):
         widget.set_position(allocation.height // 2)
 
@@ -243,6 +459,7 @@ class ScreenshotApp(Gtk.Window):
         grid = Gtk.Grid(column_spacing=10, row_spacing=10)
         section_box.pack_start(grid, False, False, 0)
         section_box.param_entries = []
+        section_box.script_title = script_title
         for i, (param_label, default) in enumerate(parameters):
             lbl = Gtk.Label(label=param_label + ":")
             lbl.set_xalign(1)
@@ -260,6 +477,26 @@ class ScreenshotApp(Gtk.Window):
         frame.add(section_box)
         return frame
 
+    def get_preview_entry(self, pixbuf):
+        key = id(pixbuf)
+        entry = self.preview_cache.get(key)
+        if entry is None or entry["pixbuf"] is not pixbuf:
+            entry = {"pixbuf": pixbuf, "scaled": {}, "temp_path": None, "serial": next(self.preview_serials),
+                     "encode_lock": threading.Lock()}
+            self.preview_cache[key] = entry
+            while len(self.preview_cache) > self.preview_cache_size:
+                _, old = self.preview_cache.popitem(last=False)
+                self.remove_preview_file(old)
+        self.preview_cache.move_to_end(key)
+        return entry
+
+    def remove_preview_file(self, entry):
+        if entry["temp_path"] and os.path.exists(entry["temp_path"]):
+            try:
+                os.remove(entry["temp_path"])
+            except OSError:
+                pass
+
     def update_global_preview(self, pixbuf, capture_name):
         self.last_pixbuf = pixbuf
         self.last_capture_name = capture_name
@@ -269,81 +506,260 @@ class ScreenshotApp(Gtk.Window):
             target_width = int(self.screen_width * self.preview_fraction)
             scale_factor = target_width / float(orig_width) if orig_width else 1
             new_height = int(pixbuf.get_height() * scale_factor)
-            scaled = pixbuf.scale_simple(target_width, new_height, GdkPixbuf.InterpType.HYPER)
+            entry = self.get_preview_entry(pixbuf)
+            size = (target_width, new_height)
+            scaled = entry["scaled"].get(size)
+            if scaled is None:
+                # Show a fast bilinear preview now and swap in the HYPER one when it is ready.
+                with trace.span("preview_scale", width=target_width, height=new_height):
+                    scaled = pixbuf.scale_simple(target_width, new_height, GdkPixbuf.InterpType.BILINEAR)
+                entry["scaled"][size] = scaled
+                if self.preview_high_quality:
+                    self.thumb_executor.submit(self.refine_preview, entry, size)
             self.global_preview.set_from_pixbuf(scaled)
 
+    def refine_preview(self, entry, size):
+        refined = entry["pixbuf"].scale_simple(size[0], size[1], GdkPixbuf.InterpType.HYPER)
+        GLib.idle_add(self.set_refined_preview, entry, size, refined)
+
+    def set_refined_preview(self, entry, size, refined):
+        entry["scaled"][size] = refined
+        if self.last_pixbuf is entry["pixbuf"]:
+            self.global_preview.set_from_pixbuf(refined)
+        return False
+
     def show_preview_dialog(self, pixbuf, title="Preview"):
         # Instead of an internal preview dialog, we open with the system's default image viewer.
-        temp_path = "temp_preview.png"
-        pixbuf.savev(temp_path, "png", [], [])
-        try:
-            image_viewer = self.config["General"].get("image_viewer", "xdg-open")
-            subprocess.run([image_viewer, temp_path])
-        except Exception as e:
-            print("Error opening external viewer:", e)
+        image_viewer = self.config["General"].get("image_viewer", "xdg-open")
+        entry = self.get_preview_entry(pixbuf)
+        def open_viewer(job):
+            # Encoded once per image; previewing the same image again reuses the file. A second
+            # preview started meanwhile waits here rather than writing the same file at once.
+            with entry["encode_lock"]:
+                temp_path = entry["temp_path"]
+                if temp_path is None or not os.path.exists(temp_path):
+                    temp_path = os.path.join(self.preview_dir,
+                                             f"preview-{entry['serial']}{encode.extension('temp', self.output_settings)}")
+                    job.set_progress(0.3, "Encoding preview")
+                    encode.save_pixbuf(pixbuf, temp_path, "temp", self.output_settings)
+                    entry["temp_path"] = temp_path
+            job.check_cancelled()
+            job.set_progress(0.8, "Opening viewer")
+            # The viewer is not waited on; it can stay open while other jobs run.
+            with trace.span("viewer_start"):
+                subprocess.Popen([image_viewer, temp_path])
+        self.jobs.submit(title, open_viewer)
         return None
 
-    def on_capture_full_clicked(self, button):
+    def save_capture(self, pixbuf, name):
+        path = name + encode.extension("final", self.output_settings)
+        self.jobs.submit(f"Save {path}", lambda job: encode.save_pixbuf(pixbuf, path, "final", self.output_settings))
+
+    def capture_after_hide(self, callback, *args):
+        """Hides the window and calls callback once it is unmapped, or after capture_delay at the latest."""
+        self.capture_pending = True
+        self.capture_started = time.time()
+        self.pending_capture = (callback, args)
+        self.capture_timeout_id = GLib.timeout_add(int(self.capture_delay * 1000), self.on_capture_ready, "timeout")
         self.hide()
-        while Gtk.events_pending():
-            Gtk.main_iteration_do(False)
-        time.sleep(self.capture_delay)
+
+    def on_unmap_event(self, widget, event):
+        if self.pending_capture is not None and self.capture_timeout_id is not None:
+            GLib.source_remove(self.capture_timeout_id)
+            # Give the compositor a moment to repaint what the window covered.
+            self.capture_timeout_id = GLib.timeout_add(int(self.capture_settle * 1000), self.on_capture_ready, "unmap")
+        return False
+
+    def on_capture_ready(self, reason):
+        self.capture_timeout_id = None
+        if self.pending_capture is None:
+            return False
+        callback, args = self.pending_capture
+        self.pending_capture = None
+        self.capture_pending = False
+        trace.record("capture_delay", self.capture_started, time.time() - self.capture_started, reason=reason)
+        callback(*args)
+        return False
+
+    def on_capture_full_clicked(self, button):
+        if self.capture_pending:
+            return
+        self.capture_after_hide(self.capture_full_screen)
+
+    def capture_full_screen(self):
         root_window = Gdk.get_default_root_window()
         width = root_window.get_width()
         height = root_window.get_height()
-        pb = Gdk.pixbuf_get_from_window(root_window, 0, 0, width, height)
+        with trace.span("capture", target="screen", width=width, height=height):
+            pb = Gdk.pixbuf_get_from_window(root_window, 0, 0, width, height)
         self.show()
         if not pb:
             print("Screenshot failed (pb is None). Are you on X11?")
-            return
-        pb.savev("screenshot.png", "png", [], [])
+            return False
+        self.save_capture(pb, "screenshot")
         self.update_global_preview(pb, "Full Screen")
         self.show_preview_dialog(pb, title="Full Screen Preview")
+        return False
 
     def populate_window_list(self):
-        for child in self.flowbox.get_children():
+        """Reconciles the cards with the current windows and re-grabs every thumbnail."""
+        if self.wnck_screen is None:
+            return
+        self.wnck_screen.force_update()
+        current = set()
+        for win in self.wnck_screen.get_windows():
+            current.add(win.get_xid())
+            self.add_window_card(win)
+        for xid in list(self.window_cards):
+            if xid not in current:
+                self.remove_window_card(xid)
+        self.thumbnail_cache.clear()
+        self.pending_thumbnails = list(self.window_cards.values())
+        self.schedule_thumbnails()
+
+    def add_window_card(self, win):
+        xid = win.get_xid()
+        if xid not in self.tracked_windows:
+            self.tracked_windows.add(xid)
+            win.connect("name-changed", self.on_wnck_window_name_changed)
+            win.connect("state-changed", self.on_wnck_window_state_changed)
+            win.connect("geometry-changed", self.on_wnck_window_geometry_changed)
+        if xid in self.window_cards or not win.get_name() or win.is_minimized():
+            return
+        card = self.create_window_card(win)
+        self.flowbox.add(card)
+        card.get_parent().show_all()
+        self.window_cards[xid] = card
+        self.queue_thumbnail(card)
+
+    def remove_window_card(self, xid):
+        card = self.window_cards.pop(xid, None)
+        if card is None:
+            return
+        if card in self.pending_thumbnails:
+            self.pending_thumbnails.remove(card)
+        child = card.get_parent()
+        if child is not None:
             self.flowbox.remove(child)
-        screen = Wnck.Screen.get_default()
-        screen.force_update()
-        windows = screen.get_windows()
-        for win in windows:
-            title = win.get_name()
-            if title and not win.is_minimized():
-                xid = win.get_xid()
-                vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
-                card_frame = Gtk.Frame()
-                card_frame.set_shadow_type(Gtk.ShadowType.IN)
-                card_frame.set_border_width(self.container_border)
-                inner_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
-                card_frame.add(inner_box)
-                btn = Gtk.Button(label=title)
-                btn.xid = xid
-                btn.connect("clicked", self.on_window_button_clicked)
-                inner_box.pack_start(btn, False, False, 0)
-                display = Gdk.Display.get_default()
-                gdk_win = GdkX11.X11Window.foreign_new_for_display(display, xid)
-                thumb = None
-                if gdk_win:
-                    geom = gdk_win.get_geometry()
-                    w_width, w_height = geom.width, geom.height
-                    pb = Gdk.pixbuf_get_from_window(gdk_win, 0, 0, w_width, w_height)
-                    if pb:
-                        new_width = self.screen_width // self.thumb_divisor
-                        scale_factor = new_width / float(w_width) if w_width else 1
-                        new_height = int(w_height * scale_factor) if w_height else 0
-                        if new_width > 0 and new_height > 0:
-                            thumb = pb.scale_simple(new_width, new_height, GdkPixbuf.InterpType.HYPER)
-                if not thumb:
-                    thumb = win.get_icon()
-                image_widget = Gtk.Image()
-                if thumb:
-                    image_widget.set_from_pixbuf(thumb)
-                else:
-                    image_widget.set_from_icon_name("application-x-executable", Gtk.IconSize.DIALOG)
-                inner_box.pack_start(image_widget, False, False, 0)
-                vbox.pack_start(card_frame, True, True, 0)
-                self.flowbox.add(vbox)
-        self.flowbox.show_all()
+
+    def queue_thumbnail(self, card, invalidate=False):
+        if invalidate:
+            self.thumbnail_cache.pop(card.xid, None)
+        if card not in self.pending_thumbnails:
+            self.pending_thumbnails.append(card)
+        self.schedule_thumbnails()
+
+    def on_wnck_window_opened(self, screen, win):
+        self.add_window_card(win)
+
+    def on_wnck_window_closed(self, screen, win):
+        xid = win.get_xid()
+        self.remove_window_card(xid)
+        self.thumbnail_cache.pop(xid, None)
+        self.tracked_windows.discard(xid)
+
+    def on_wnck_stacking_changed(self, screen):
+        # A window raised to the top may have been partly covered when it was last grabbed.
+        active = screen.get_active_window()
+        card = self.window_cards.get(active.get_xid()) if active else None
+        if card is not None:
+            self.queue_thumbnail(card, invalidate=True)
+
+    def on_wnck_window_name_changed(self, win):
+        card = self.window_cards.get(win.get_xid())
+        if card is None:
+            self.add_window_card(win)
+        elif win.get_name():
+            card.button.set_label(win.get_name())
+        else:
+            self.remove_window_card(win.get_xid())
+
+    def on_wnck_window_state_changed(self, win, changed_mask, new_state):
+        if win.is_minimized():
+            self.remove_window_card(win.get_xid())
+        else:
+            self.add_window_card(win)
+
+    def on_wnck_window_geometry_changed(self, win):
+        card = self.window_cards.get(win.get_xid())
+        if card is not None:
+            self.queue_thumbnail(card)
+
+    def create_window_card(self, win):
+        # The card starts with the window icon; the real thumbnail arrives once it scrolls into view.
+        xid = win.get_xid()
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        vbox.xid = xid
+        card_frame = Gtk.Frame()
+        card_frame.set_shadow_type(Gtk.ShadowType.IN)
+        card_frame.set_border_width(self.container_border)
+        inner_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        card_frame.add(inner_box)
+        btn = Gtk.Button(label=win.get_name())
+        btn.xid = xid
+        btn.connect("clicked", self.on_window_button_clicked)
+        inner_box.pack_start(btn, False, False, 0)
+        vbox.button = btn
+        image_widget = Gtk.Image()
+        icon = win.get_icon()
+        if icon:
+            image_widget.set_from_pixbuf(icon)
+        else:
+            image_widget.set_from_icon_name("application-x-executable", Gtk.IconSize.DIALOG)
+        inner_box.pack_start(image_widget, False, False, 0)
+        vbox.thumbnail = image_widget
+        vbox.pack_start(card_frame, True, True, 0)
+        return vbox
+
+    def schedule_thumbnails(self, *args):
+        if self.thumbnail_idle_id is None and self.pending_thumbnails:
+            self.thumbnail_idle_id = GLib.idle_add(self.render_next_thumbnail, priority=GLib.PRIORITY_LOW)
+
+    def is_card_visible(self, card):
+        child = card.get_parent()
+        if child is None:
+            return False
+        alloc = child.get_allocation()
+        adj = self.scrolled_list.get_vadjustment()
+        top = adj.get_value()
+        bottom = top + adj.get_page_size()
+        return alloc.height > 1 and alloc.y < bottom and alloc.y + alloc.height > top
+
+    def render_next_thumbnail(self):
+        card = next((c for c in self.pending_thumbnails if self.is_card_visible(c)), None)
+        if card is None:
+            self.thumbnail_idle_id = None
+            return False
+        self.pending_thumbnails.remove(card)
+        # Grabbing has to happen on the main loop; scaling does not.
+        display = Gdk.Display.get_default()
+        gdk_win = GdkX11.X11Window.foreign_new_for_display(display, card.xid)
+        if gdk_win:
+            geom = gdk_win.get_geometry()
+            w_width, w_height = geom.width, geom.height
+            signature = (w_width, w_height)
+            cached = self.thumbnail_cache.get(card.xid)
+            if cached and cached[0] == signature:
+                card.thumbnail.set_from_pixbuf(cached[1])
+                return True
+            pb = Gdk.pixbuf_get_from_window(gdk_win, 0, 0, w_width, w_height)
+            if pb:
+                new_width = self.screen_width // self.thumb_divisor
+                scale_factor = new_width / float(w_width) if w_width else 1
+                new_height = int(w_height * scale_factor) if w_height else 0
+                if new_width > 0 and new_height > 0:
+                    self.thumb_executor.submit(self.scale_thumbnail, card, pb, new_width, new_height, signature)
+        return True
+
+    def scale_thumbnail(self, card, pixbuf, width, height, signature):
+        thumb = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+        GLib.idle_add(self.set_thumbnail, card, thumb, signature)
+
+    def set_thumbnail(self, card, thumb, signature):
+        if self.window_cards.get(card.xid) is card:
+            self.thumbnail_cache[card.xid] = (signature, thumb)
+            card.thumbnail.set_from_pixbuf(thumb)
+        return False
 
     def on_window_button_clicked(self, button):
         xid = button.xid
@@ -352,52 +768,187 @@ class ScreenshotApp(Gtk.Window):
         if not gdk_win:
             print("Failed to get Gdk.Window for XID", xid)
             return
+        if self.capture_pending:
+            return
+        if self.hide_for_window_capture == "auto" and not self.overlaps_window(gdk_win):
+            # Nothing of ours covers the target, so grab it right away.
+            self.capture_window(gdk_win, xid, button.get_label())
+            return
+        self.capture_after_hide(self.capture_window, gdk_win, xid, button.get_label())
+
+    def overlaps_window(self, gdk_win):
+        """Whether this app's window (frame included) intersects gdk_win on screen."""
+        own = self.get_window()
+        if own is None or not own.is_visible():
+            return False
+        a, b = own.get_frame_extents(), gdk_win.get_frame_extents()
+        return (a.x < b.x + b.width and b.x < a.x + a.width and
+                a.y < b.y + b.height and b.y < a.y + a.height)
+
+    def capture_window(self, gdk_win, xid, title):
         geom = gdk_win.get_geometry()
         width, height = geom.width, geom.height
-        self.hide()
-        while Gtk.events_pending():
-            Gtk.main_iteration_do(False)
-        time.sleep(self.capture_delay)
-        pb = Gdk.pixbuf_get_from_window(gdk_win, 0, 0, width, height)
+        with trace.span("capture", target="window", width=width, height=height):
+            pb = Gdk.pixbuf_get_from_window(gdk_win, 0, 0, width, height)
         self.show()
         if not pb:
             print("Failed to capture window with XID", xid)
-            return
-        pb.savev("window_screenshot.png", "png", [], [])
-        self.update_global_preview(pb, button.get_label())
+            return False
+        self.save_capture(pb, "window_screenshot")
+        self.update_global_preview(pb, title)
         self.show_preview_dialog(pb, title="Window Capture Preview")
+        return False
 
     def on_run_script(self, button, script_name, container):
         if self.last_pixbuf is None:
             print("No capture available!")
             return
-        temp_input = "last_capture.png"
-        self.last_pixbuf.savev(temp_input, "png", [], [])
         params = []
         if container is not None and hasattr(container, "param_entries"):
             params = [entry.get_text() for entry in container.param_entries]
-        subprocess.run(["python3", script_name, temp_input, "processed.png"] + params)
+        pixbuf = self.last_pixbuf
+        use_pool = self.script_pool is not None and has_entry_point(script_name)
+        title = getattr(container, "script_title", script_name)
+        self.jobs.submit(title,
+                         lambda job: self.run_script_job(job, script_name, pixbuf, params, use_pool),
+                         on_done=lambda pb: self.on_script_done(script_name, pb))
+
+    def run_script_job(self, job, script_name, pixbuf, params, use_pool):
+        """Runs in a job thread; returns the processed pixbuf."""
+        if use_pool:
+            # Hand the frame over as raw pixels; PNG is only encoded when the user saves.
+            temp_input = rawimage.temp_path(f"last_capture-{job.id}")
+            temp_output = rawimage.temp_path(f"processed-{job.id}")
+            try:
+                job.set_progress(0.1, "Preparing input")
+                with trace.span("raw_write"):
+                    pixbuf_to_raw(pixbuf, temp_input)
+                job.set_progress(0.2, "Running in worker")
+                with trace.span("script", script=script_name, pool=True):
+                    for attempt in range(2):
+                        future = self.script_pool.submit(script_name, temp_input, temp_output, params)
+                        try:
+                            job.wait_future(future, cancel=lambda future=future: self.script_pool.cancel(future))
+                            break
+                        except BrokenProcessPool:
+                            # Cancelling another job restarts the workers; run this one again.
+                            job.check_cancelled()
+                            if attempt:
+                                raise
+                            job.set_progress(0.2, "Workers restarted, running again")
+                job.set_progress(0.9, "Loading result")
+                with trace.span("reload"):
+                    return pixbuf_from_raw(temp_output)
+            finally:
+                # A worker stopped mid-write leaves its temp file behind.
+                for path in [temp_input, temp_output] + glob.glob(glob.escape(temp_output) + ".*.tmp"):
+                    if os.path.exists(path):
+                        os.remove(path)
+        ext = encode.extension("temp", self.output_settings)
+        temp_input = f"last_capture-{job.id}{ext}"
+        temp_output = f"processed-{job.id}{ext}"
         try:
-            pb_processed = GdkPixbuf.Pixbuf.new_from_file("processed.png")
-            self.show_preview_dialog(pb_processed, title=f"{script_name} Preview")
+            job.set_progress(0.1, "Saving input")
+            encode.save_pixbuf(pixbuf, temp_input, "temp", self.output_settings)
+            job.check_cancelled()
+            job.set_progress(0.2, "Running script")
+            env = dict(os.environ, **{encode.PURPOSE_ENV: "temp"})
+            with trace.span("script", script=script_name, pool=False):
+                with trace.span("subprocess_start"):
+                    proc = subprocess.Popen(["python3", script_name, temp_input, temp_output] + params, env=env)
+                job.on_cancel(proc.kill)
+                proc.wait()
+            job.check_cancelled()
+            job.set_progress(0.9, "Loading result")
+            with trace.span("reload"):
+                return pixbuf_from_file(temp_output)
+        finally:
+            for path in (temp_input, temp_output):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def on_script_done(self, script_name, pb_processed):
+        self.processed_pixbuf = pb_processed
+        self.show_preview_dialog(pb_processed, title=f"{script_name} Preview")
+        with trace.span("clipboard"):
             clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             clipboard.set_image(pb_processed)
             clipboard.store()
-        except Exception as e:
-            print("Error loading processed image:", e)
-        
+
+    def on_job_update(self, job):
+        row = self.job_rows.get(job.id)
+        if row is None:
+            if job.finished and job.state == "done":
+                return
+            row = Gtk.ListBoxRow()
+            box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+            box.set_border_width(5)
+            row.label = Gtk.Label()
+            row.label.set_xalign(0)
+            row.bar = Gtk.ProgressBar()
+            row.bar.set_valign(Gtk.Align.CENTER)
+            row.button = Gtk.Button(label="Cancel")
+            row.button.set_tooltip_text("Stop this job. A script already running in a worker is stopped by "
+                                        "restarting the workers, and other running scripts start over.")
+            row.button.connect("clicked", self.on_job_button_clicked, job)
+            box.pack_start(row.label, True, True, 0)
+            box.pack_start(row.bar, True, True, 0)
+            box.pack_start(row.button, False, False, 0)
+            row.add(box)
+            self.job_list.add(row)
+            row.show_all()
+            self.job_rows[job.id] = row
+        row.label.set_text(f"{job.title}: {job.status}")
+        row.bar.set_fraction(job.progress)
+        if job.state == "done":
+            GLib.timeout_add_seconds(3, self.remove_job_row, job.id)
+        elif job.finished:
+            row.button.set_label("Dismiss")
+
+    def on_job_button_clicked(self, button, job):
+        if job.finished:
+            self.remove_job_row(job.id)
+        else:
+            job.cancel()
+
+    def remove_job_row(self, job_id):
+        row = self.job_rows.pop(job_id, None)
+        if row is not None:
+            self.job_list.remove(row)
+        return False
+
     def on_preview_processed(self, button):
-        if os.path.exists("processed.png"):
+        pb = self.processed_pixbuf
+        if pb is None:
+            print("No processed image available.")
+            return
+        self.show_preview_dialog(pb, title="Processed Image Preview")
+        with trace.span("clipboard"):
+            clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+            clipboard.set_image(pb)
+            clipboard.store()
+
+    def on_save_processed(self, button):
+        if self.processed_pixbuf is None:
+            print("No processed image available.")
+            return
+        dialog = Gtk.FileChooserDialog(
+            title="Save Processed Image", parent=self,
+            action=Gtk.FileChooserAction.SAVE,
+            buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                     Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        )
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("processed" + encode.extension("final", self.output_settings))
+        response = dialog.run()
+        if response == Gtk.ResponseType.OK:
+            filename = dialog.get_filename()
             try:
-                pb = GdkPixbuf.Pixbuf.new_from_file("processed.png")
-                self.show_preview_dialog(pb, title="Processed Image Preview")
-                clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
-                clipboard.set_image(pb)
-                clipboard.store()
+                encode.save_pixbuf(self.processed_pixbuf, filename, "final", self.output_settings)
+                print("Saved processed image to", filename)
             except Exception as e:
-                print("Error loading processed image:", e)
-        else:
-            print("No processed image available.")
+                print("Error saving processed image:", e)
+        dialog.destroy()
 
     def on_process_clicked(self, button):
         self.on_run_script(button, "process_image.py", None)
@@ -413,9 +964,13 @@ class ScreenshotApp(Gtk.Window):
         filter_img.set_name("Image files")
         filter_img.add_mime_type("image/png")
         filter_img.add_mime_type("image/jpeg")
+        filter_img.add_mime_type("image/webp")
+        filter_img.add_mime_type("image/bmp")
         filter_img.add_pattern("*.png")
         filter_img.add_pattern("*.jpg")
         filter_img.add_pattern("*.jpeg")
+        filter_img.add_pattern("*.webp")
+        filter_img.add_pattern("*.bmp")
         dialog.add_filter(filter_img)
 
         response = dialog.run()
@@ -423,7 +978,7 @@ class ScreenshotApp(Gtk.Window):
             selected_file = dialog.get_filename()
             print("Selected file:", selected_file)
             # Load the selected image.
-            pb = GdkPixbuf.Pixbuf.new_from_file(selected_file)
+            pb = pixbuf_from_file(selected_file)
             if pb:
                 self.last_pixbuf = pb
                 self.last_capture_name = os.path.basename(selected_file)
@@ -435,4 +990,14 @@ class ScreenshotApp(Gtk.Window):
 if __name__ == "__main__":
     app = ScreenshotApp()
     app.connect("destroy", Gtk.main_quit)
-    Gtk.main()
\ No newline at end of file
+    Gtk.main()
+    app.jobs.shutdown()
+    app.thumb_executor.shutdown(wait=False, cancel_futures=True)
+    for entry in app.preview_cache.values():
+        app.remove_preview_file(entry)
+    try:
+        os.rmdir(app.preview_dir)
+    except OSError:
+        pass
+    if app.script_pool:
+        app.script_pool.shutdown()
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Background jobs for the GTK app.
+
+Job functions run on a small thread pool and must not touch widgets. Progress
+updates and results are handed back to the GTK main loop with GLib.idle_add,
+so the on_update/on_done/on_error callbacks are free to update the UI.
+"""
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from gi.repository import GLib
+
+from common import trace
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id, title, func, on_done=None, on_error=None):
+        self.id = job_id
+        self.title = title
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.state = "queued"
+        self.status = "Queued"
+        self.progress = 0.0
+        self.queue = None
+        self._cancel_event = threading.Event()
+        self._cancel_hooks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def cancel(self):
+        with self._lock:
+            if self.finished or self.cancelled:
+                return
+            self._cancel_event.set()
+            hooks = list(self._cancel_hooks)
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"Error cancelling job '{self.title}':", e)
+        self.set_progress(self.progress, "Cancelling...")
+
+    def on_cancel(self, hook):
+        """Registers a callable (e.g. Popen.kill) to run when the job is cancelled."""
+        with self._lock:
+            if not self._cancel_event.is_set():
+                self._cancel_hooks.append(hook)
+                return
+        hook()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def set_progress(self, fraction, status=None):
+        self.progress = fraction
+        if status is not None:
+            self.status = status
+        if self.queue is not None:
+            self.queue.notify(self)
+
+    def wait_future(self, future, poll_interval=0.1, cancel=None):
+        """Waits on a concurrent future while staying responsive to cancel().
+
+        cancel() is called on the future unless another canceller is given,
+        e.g. one that can stop a call that is already running.
+        """
+        self.on_cancel(cancel or future.cancel)
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except FutureTimeoutError:
+                self.check_cancelled()
+
+class JobQueue:
+    def __init__(self, workers=2, on_update=None):
+        self.on_update = on_update
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="smartscreenshot-job")
+        self._ids = itertools.count(1)
+        self.jobs = {}
+
+    def submit(self, title, func, on_done=None, on_error=None):
+        """Queues func(job); on_done(result) and on_error(exc) run on the main loop."""
+        job = Job(next(self._ids), title, func, on_done, on_error)
+        job.queue = self
+        self.jobs[job.id] = job
+        self.notify(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def notify(self, job):
+        if self.on_update is not None:
+            GLib.idle_add(self._dispatch_update, job)
+
+    def _dispatch_update(self, job):
+        self.on_update(job)
+        return False
+
+    def _run(self, job):
+        result, error = None, None
+        if job.cancelled:
+            job.state = "cancelled"
+        else:
+            job.state = "running"
+            job.set_progress(0.0, "Running")
+            with trace.span("job", title=job.title) as details:
+                try:
+                    result = job.func(job)
+                    job.check_cancelled()
+                    job.state = "done"
+                except JobCancelled:
+                    job.state = "cancelled"
+                except Exception as e:
+                    job.state = "failed"
+                    error = e
+                details["state"] = job.state
+        GLib.idle_add(self._finish, job, result, error)
+
+    def _finish(self, job, result, error):
+        if job.state == "done":
+            job.progress, job.status = 1.0, "Done"
+            if job.on_done is not None:
+                job.on_done(result)
+        elif job.state == "failed":
+            job.status = f"Failed: {error}"
+            print(f"Job '{job.title}' failed:", error)
+            if job.on_error is not None:
+                job.on_error(error)
+        else:
+            job.status = "Cancelled"
+        self.jobs.pop(job.id, None)
+        if self.on_update is not None:
+            self.on_update(job)
+        return False
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
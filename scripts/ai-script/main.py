@@ -1,102 +1,254 @@
 #!/usr/bin/env python3
-import cv2
-import pytesseract
-import re
+import collections
+import hashlib
+import hmac
+import json
 import os
+import secrets
 import sys
 from transformers import pipeline
 
-def expand_box(x, y, w, h, expand=10, img_width=None, img_height=None):
-    new_x = max(0, x - expand)
-    new_y = max(0, y - expand)
-    new_w = w + 2 * expand
-    new_h = h + 2 * expand
-    if img_width and new_x + new_w > img_width:
-        new_w = img_width - new_x
-    if img_height and new_y + new_h > img_height:
-        new_h = img_height - new_y
-    return new_x, new_y, new_w, new_h
-
-def blur_region(img, x, y, w, h, kernel_size, sigma, expand=15):
-    """Blurs a region with Gaussian blur."""
-    img_h, img_w = img.shape[:2]
-    x, y, w, h = expand_box(x, y, w, h, expand, img_w, img_h)
-    roi = img[y:y+h, x:x+w]
-    k = max(15, (min(w, h) // 2) | 1)  # Ensure kernel size is odd
-    blurred_roi = cv2.GaussianBlur(roi, (kernel_size, kernel_size), sigma)
-    img[y:y+h, x:x+w] = blurred_roi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import ocr, preprocess, rawimage, redact, trace
+from common.candidates import CandidateFilter, load_stopwords
+from common.detect import Detector
+from common.layout import LineIndex
 
-def main():
-    if len(sys.argv) < 4:
-        print(f"Usage: {sys.argv[0]} <input_image> <output_image> <sensitive_labels_comma_separated> [kernel_size] [sigma]")
-        sys.exit(1)
-    
-    image_path = sys.argv[1]
-    output_path = sys.argv[2]
-    sensitive_labels = sys.argv[3].split(",")
-    kernel_size = int(sys.argv[4]) if len(sys.argv) > 4 else 99
-    sigma = float(sys.argv[5]) if len(sys.argv) > 5 else 30
+MODEL_NAME = "facebook/bart-large-mnli"
+CANDIDATE_LABELS = ["password", "normal text"]
+BATCH_SIZE = 32
+SCORE_THRESHOLD = 0.7
+SCORE_CACHE_DIR = os.path.join(ocr.CACHE_DIR, "classifier")
+SCORE_CACHE_PATH = os.path.join(SCORE_CACHE_DIR, "scores.json")
+# Random per-user key the token hashes are made with, so they cannot be checked against guessed secrets.
+SCORE_KEY_PATH = os.path.join(SCORE_CACHE_DIR, "scores.key")
+SCORE_CACHE_ENTRIES = 50000
+# Specific rules come first so they are the ones reported when the generic one would also match.
+SECRET_PATTERNS = {
+    "aws_access_key": r'AKIA[0-9A-Z]{16}',
+    "github_token": r'ghp_[A-Za-z0-9]{36}',
+    "google_api_key": r'AIza[0-9A-Za-z-_]{35}',
+    "jwt": r'eyJ[a-zA-Z0-9]{30,}',
+    "long_token": r'[A-Za-z0-9_\-]{20,}',
+}
+
+# The classifier was tuned on adaptively thresholded text read as a single block.
+ocr_options = preprocess.load_options("ai-script", threshold="adaptive", psm=6, oem=3)
+
+# Kept for the lifetime of the process, so warm workers load the model once.
+_classifier = None
+_score_cache = None
+_score_secret = None
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = pipeline("zero-shot-classification", model=MODEL_NAME)
+    return _classifier
+
+def score_secret():
+    """The cache's HMAC key, created at 0600 on first use; None when it cannot be read or made."""
+    global _score_secret
+    if _score_secret is None:
+        try:
+            os.makedirs(SCORE_CACHE_DIR, mode=0o700, exist_ok=True)
+            try:
+                fd = os.open(SCORE_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Another worker made it first.
+                with open(SCORE_KEY_PATH, "rb") as f:
+                    secret = f.read()
+            else:
+                secret = secrets.token_bytes(32)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(secret)
+        except OSError as e:
+            print("Warning: could not read classifier score cache key:", e)
+            return None
+        if len(secret) < 32:
+            print("Warning: classifier score cache key is truncated; not caching scores.")
+            return None
+        _score_secret = secret
+    return _score_secret
+
+def score_key(text, secret):
+    # Only a keyed hash of the token is stored, never the (possibly secret) text itself.
+    return hmac.new(secret, f"{MODEL_NAME}\0{text}".encode(), hashlib.sha256).hexdigest()
+
+def read_score_cache():
+    try:
+        with open(SCORE_CACHE_PATH, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def load_score_cache():
+    global _score_cache
+    if _score_cache is None:
+        _score_cache = read_score_cache()
+    return _score_cache
+
+def save_score_cache(new_scores):
+    """Adds new_scores to the scores on disk, so scores saved meanwhile by other workers are kept."""
+    cache = read_score_cache()
+    cache.update(_score_cache)
+    for key, score in new_scores.items():
+        cache.pop(key, None)
+        cache[key] = score
+    # Dicts keep insertion order, so the oldest scores are dropped first.
+    for key in list(cache)[:max(0, len(cache) - SCORE_CACHE_ENTRIES)]:
+        del cache[key]
+    os.makedirs(SCORE_CACHE_DIR, mode=0o700, exist_ok=True)
+    tmp_path = f"{SCORE_CACHE_PATH}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, SCORE_CACHE_PATH)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _score_cache.clear()
+    _score_cache.update(cache)
+
+def password_scores(texts):
+    """Returns {text: P(password)} for each distinct text, classifying uncached ones in batches."""
+    secret = score_secret()
+    cache = load_score_cache() if secret is not None else {}
+    scores = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        cached = cache.get(score_key(text, secret)) if secret is not None else None
+        if cached is None:
+            pending.append(text)
+        else:
+            scores[text] = cached
+    print(f"Classifying {len(pending)} distinct tokens ({len(scores)} cached).")
+    if pending:
+        with trace.span("classify", tokens=len(pending)):
+            results = get_classifier()(pending, candidate_labels=CANDIDATE_LABELS, batch_size=BATCH_SIZE)
+        if isinstance(results, dict):
+            results = [results]
+        new_scores = {}
+        for text, result in zip(pending, results):
+            score = dict(zip(result["labels"], result["scores"]))["password"]
+            scores[text] = score
+            if secret is not None:
+                new_scores[score_key(text, secret)] = score
+        if new_scores:
+            try:
+                save_score_cache(new_scores)
+            except OSError as e:
+                print("Warning: could not write classifier score cache:", e)
+    return scores
+
+def param(params, index, convert, default):
+    """Converts params[index], or returns default when it is missing, blank or invalid."""
+    if len(params) <= index or not params[index].strip():
+        return default
+    try:
+        return convert(params[index])
+    except ValueError:
+        print(f"Ignoring invalid parameter {index + 1} '{params[index]}'; using {default}.")
+        return default
+
+def parse_params(params):
+    sensitive_labels = param(params, 0, lambda value: value.split(","), ["password"])
+    kernel_size = param(params, 1, int, 99)
+    sigma = param(params, 2, float, 30)
+    candidate_filter = CandidateFilter()
+    candidate_filter.min_length = param(params, 3, int, candidate_filter.min_length)
+    candidate_filter.min_entropy = param(params, 4, float, candidate_filter.min_entropy)
+    style = param(params, 5, redact.parse_style, "blur")
+    candidate_filter.min_char_classes = param(params, 6, int, candidate_filter.min_char_classes)
+    stopwords_path = param(params, 7, os.path.expanduser, None)
+    if stopwords_path is not None:
+        candidate_filter.stopwords = candidate_filter.stopwords | load_stopwords(stopwords_path)
     
     if kernel_size % 2 == 0:
         kernel_size += 1
+    return sensitive_labels, kernel_size, sigma, candidate_filter, style
+
+def process(image, params):
+    sensitive_labels, kernel_size, sigma, candidate_filter, style = parse_params(params)
     
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Error: Could not read the image file '{image_path}'")
-        sys.exit(1)
-    
-    print("Image loaded successfully.")
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-    
-    data = pytesseract.image_to_data(gray, config='--oem 3 --psm 6', output_type=pytesseract.Output.DICT)
+    data = preprocess.image_to_data(image, ocr_options)
     texts, lefts, tops, widths, heights = data["text"], data["left"], data["top"], data["width"], data["height"]
     
     print(f"Detected {len([t for t in texts if t.strip()])} non-empty text regions.")
-    secret_patterns = [
-        re.compile(r'[A-Za-z0-9_\-]{20,}'),
-        re.compile(r'AKIA[0-9A-Z]{16}'),
-        re.compile(r'ghp_[A-Za-z0-9]{36}'),
-        re.compile(r'AIza[0-9A-Za-z-_]{35}'),
-        re.compile(r'eyJ[a-zA-Z0-9]{30,}')
-    ]
+    detector = Detector(labels=sensitive_labels, patterns=SECRET_PATTERNS, anchored=True)
+    index = LineIndex(data, y_tolerance=15)
     
-    sensitive_boxes = []
-    for i, text in enumerate(texts):
-        text = text.strip().lower()
-        if not text:
-            continue
-        
-        if any(label.lower() in text for label in sensitive_labels):
-            print(f"Found potential sensitive label: '{texts[i]}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-            
-            for j in range(i + 1, len(texts)):
-                if abs(tops[j] - tops[i]) < 15 and texts[j].strip():
+    with trace.span("match"):
+        sensitive_boxes = []
+        for i, text in enumerate(texts):
+            text = text.strip()
+            if not text:
+                continue
+            match = detector.detect(text)
+            if match is None:
+                continue
+            kind, rule = match
+
+            if kind == "label":
+                print(f"Found potential sensitive label '{rule}': '{texts[i]}'")
+                sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
+
+                for j in index.values_right_of(i):
                     print(f"Blurring subsequent text as sensitive value: '{texts[j]}'")
                     sensitive_boxes.append((lefts[j], tops[j], widths[j], heights[j]))
-                    break
-        elif any(pattern.match(text) for pattern in secret_patterns):
-            print(f"Found potential secret: '{texts[i]}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-    
-    classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-    for i, text in enumerate(texts):
-        text = text.strip()
-        if not text or any((lefts[i], tops[i], widths[i], heights[i]) == box for box in sensitive_boxes):
-            continue
-        result = classifier(text, candidate_labels=["password", "normal text"])
-        score = result["scores"][0] if result["labels"][0] == "password" else 1 - result["scores"][0]
-        if result["labels"][0] == "password" and score > 0.7:
+            else:
+                print(f"Found potential secret ({rule}): '{texts[i]}'")
+                sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
+
+        flagged = set(sensitive_boxes)
+        candidates = []
+        skipped = collections.Counter()
+        for i, text in enumerate(texts):
+            text = text.strip()
+            if not text or (lefts[i], tops[i], widths[i], heights[i]) in flagged:
+                continue
+            reason = candidate_filter.skip_reason(text)
+            if reason is None:
+                candidates.append((i, text))
+            else:
+                skipped[reason] += 1
+        if skipped:
+            details = ", ".join(f"{reason}: {count}" for reason, count in skipped.most_common())
+            print(f"Candidate filter skipped {sum(skipped.values())} tokens ({details}).")
+    scores = password_scores([text for _, text in candidates])
+    for i, text in candidates:
+        score = scores[text]
+        if score > SCORE_THRESHOLD:
             print(f"Classified '{text}' as sensitive with score {score:.3f}")
             sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
     
     print(f"Number of sensitive regions detected: {len(sensitive_boxes)}")
     
-    for box in sensitive_boxes:
-        blur_region(image, *box, kernel_size, sigma)
+    redact.blur_boxes(image, sensitive_boxes, kernel_size, sigma, expand=15, style=style)
+    return image
+
+def main():
+    if len(sys.argv) < 4:
+        print(f"Usage: {sys.argv[0]} <input_image> <output_image> <sensitive_labels_comma_separated> [kernel_size] [sigma] [min_candidate_length] [min_candidate_entropy] [blur|pixelate|fill]")
+        sys.exit(1)
+    
+    image_path = sys.argv[1]
+    output_path = sys.argv[2]
+    
+    image = rawimage.imread(image_path)
+    if image is None:
+        print(f"Error: Could not read the image file '{image_path}'")
+        sys.exit(1)
+    
+    print("Image loaded successfully.")
+    process(image, sys.argv[3:])
     
-    cv2.imwrite(output_path, image)
+    rawimage.imwrite(output_path, image)
     print(f"Processed image saved as '{output_path}'.")
     
 if __name__ == "__main__":
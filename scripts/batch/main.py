@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Runs a configured script over many screenshots without the GTK app.
+
+Scripts that define process() run in a pool of warm worker processes (one per
+core by default), so cv2, Tesseract bindings and the OCR cache are loaded once
+per worker rather than once per file. Other scripts are run as one python3
+process per file. A manifest in the output directory records what was done,
+so an interrupted run picks up where it stopped.
+"""
+import argparse
+import collections
+import configparser
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import encode
+from common.worker import ScriptPool, has_entry_point
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+MANIFEST_NAME = ".smartscreenshot-batch.json"
+# The manifest is rewritten after this many completed files, and at the end.
+MANIFEST_FLUSH_EVERY = 25
+OCR_WORKERS_ENV = "SMARTSCREENSHOT_OCR_WORKERS"
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gtk-app")
+
+def default_config_path():
+    return os.path.join(os.path.expanduser("~"), ".config", "smartscreenshot", "smartscreenshot.ini")
+
+def load_scripts(config_path, scripts_path=None):
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if scripts_path is None:
+        scripts_path = config.get("General", "scripts_config", fallback=os.path.join(
+            os.path.expanduser("~"), ".config", "smartscreenshot", "scripts.json"))
+    if not os.path.exists(scripts_path):
+        return []
+    try:
+        with open(scripts_path, "r") as f:
+            return json.load(f).get("scripts", [])
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error: Could not read scripts config '{scripts_path}': {e}")
+        return []
+
+def resolve_script_path(path):
+    """Paths in scripts.json are relative to where the app runs (gtk-app/), or to the current directory."""
+    if os.path.isabs(path) or os.path.exists(path):
+        return os.path.abspath(path)
+    return os.path.abspath(os.path.join(APP_DIR, path))
+
+def find_script(scripts, name):
+    """Looks a script up by its name in scripts.json, or takes name as a path to a .py file."""
+    for script in scripts:
+        if script.get("name") == name:
+            params = [p.get("default", "") for p in script.get("parameters", [])]
+            return resolve_script_path(script.get("path", "")), params
+    if name.endswith(".py") and os.path.exists(name):
+        return os.path.abspath(name), []
+    return None, None
+
+def glob_root(pattern):
+    """The leading directories of a glob pattern that contain no wildcards."""
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or (os.sep if pattern.startswith(os.sep) else ".")
+
+def is_within(path, directory):
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+def collect_inputs(patterns, exclude_dir=None):
+    """Returns (input path, path relative to its root) for directories (recursive) and globs.
+
+    Files under exclude_dir (the output directory) are left out, so earlier
+    results are not processed again as inputs.
+    """
+    inputs = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        path = os.path.join(root, name)
+                        inputs.append((os.path.abspath(path), os.path.relpath(path, pattern)))
+        else:
+            root = glob_root(pattern)
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                    inputs.append((os.path.abspath(path), os.path.relpath(path, root)))
+    unique = {}
+    excluded = 0
+    for path, relative in inputs:
+        if exclude_dir is not None and is_within(path, exclude_dir):
+            excluded += 1
+            continue
+        unique.setdefault(path, relative)
+    if excluded:
+        print(f"Skipping {excluded} images inside the output directory.")
+    return list(unique.items())
+
+def output_paths(inputs, output_dir, ext):
+    """Maps each input to its output path, keeping inputs that would share one apart.
+
+    Inputs whose names differ only in extension (x.png and x.jpg) keep it in
+    the output name (x.png.png, x.jpg.png); any collision left, such as the
+    same relative path under two input directories, gets a numbered suffix.
+    """
+    def target(relative, keep_extension):
+        base = relative if keep_extension else os.path.splitext(relative)[0]
+        return os.path.abspath(os.path.join(output_dir, base + ext))
+    extensions = collections.defaultdict(set)
+    for _, relative in inputs:
+        extensions[target(relative, False)].add(os.path.splitext(relative)[1].lower())
+    outputs = {}
+    taken = set()
+    for path, relative in inputs:
+        output = target(relative, len(extensions[target(relative, False)]) > 1)
+        stem, number = output[:-len(ext)], 2
+        while output in taken:
+            output = f"{stem}-{number}{ext}"
+            number += 1
+        if output != target(relative, False):
+            print(f"Output names collide; '{path}' is saved as '{output}'.")
+        taken.add(output)
+        outputs[path] = output
+    return outputs
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def input_signature(input_path, script_path, params):
+    stat = os.stat(input_path)
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "script": script_path, "params": list(params)}
+
+def is_done(manifest, input_path, signature, output_path):
+    entry = manifest.get(input_path)
+    if not entry or entry.get("output") != output_path or not os.path.exists(output_path):
+        return False
+    return all(entry.get(key) == value for key, value in signature.items())
+
+def run_subprocess(script_path, input_path, output_path, params):
+    """One python3 process per file, for scripts without process()."""
+    started = time.perf_counter()
+    result = subprocess.run(["python3", script_path, input_path, output_path] + list(params),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else
+                           f"exited with status {result.returncode}")
+    return output_path, time.perf_counter() - started
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run a SmartScreenshot script over many images.")
+    parser.add_argument("inputs", nargs="*", help="directories (searched recursively) or glob patterns")
+    parser.add_argument("-s", "--script", help="script name from scripts.json, or a path to a script")
+    parser.add_argument("-o", "--output-dir", default="redacted", help="where processed images go (default: redacted)")
+    parser.add_argument("-p", "--param", action="append", dest="params",
+                        help="script parameter, repeat in order; defaults come from scripts.json")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="parallel workers (default: number of CPUs)")
+    parser.add_argument("-c", "--config", default=default_config_path(), help="smartscreenshot.ini to use")
+    parser.add_argument("--scripts-config", help="scripts.json to use instead of the one in the config")
+    parser.add_argument("-f", "--force", action="store_true", help="reprocess files listed in the manifest")
+    parser.add_argument("-l", "--list", action="store_true", help="list the configured scripts and exit")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    # Workers pick up the [Output] settings from the same ini.
+    os.environ[encode.CONFIG_ENV] = os.path.abspath(args.config)
+    scripts = load_scripts(args.config, args.scripts_config)
+    if args.list:
+        for script in scripts:
+            labels = ", ".join(p.get("label", "") for p in script.get("parameters", []))
+            print(f"{script.get('name')}: {script.get('path')} [{labels}]")
+        return
+    if not args.script or not args.inputs:
+        print("Error: --script and at least one input are required (see --help).")
+        sys.exit(1)
+
+    script_path, params = find_script(scripts, args.script)
+    if script_path is None or not os.path.exists(script_path):
+        print(f"Error: Unknown script '{args.script}'. Use --list to see the configured scripts.")
+        sys.exit(1)
+    if args.params is not None:
+        params = args.params + params[len(args.params):]
+
+    inputs = collect_inputs(args.inputs, args.output_dir)
+    if not inputs:
+        print("No images found.")
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    ext = encode.extension("final", encode.load_settings())
+    outputs = output_paths(inputs, args.output_dir, ext)
+
+    todo = []
+    skipped = 0
+    for input_path, _ in inputs:
+        signature = input_signature(input_path, script_path, params)
+        if not args.force and is_done(manifest, input_path, signature, outputs[input_path]):
+            skipped += 1
+            continue
+        todo.append((input_path, outputs[input_path], signature))
+    print(f"{len(inputs)} images, {skipped} already processed, {len(todo)} to do with {args.workers} workers.")
+
+    # Every worker OCRs in parallel bands of its own; share the cores out instead of multiplying them.
+    os.environ.setdefault(OCR_WORKERS_ENV, str(max(1, (os.cpu_count() or 1) // max(1, args.workers))))
+    if has_entry_point(script_path):
+        pool = ScriptPool(args.workers)
+        pool.warm([script_path])
+        submit = lambda i, o: pool.submit(script_path, i, o, params, timed=True)
+    else:
+        pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        submit = lambda i, o: pool.submit(run_subprocess, script_path, i, o, params)
+
+    started = time.perf_counter()
+    done = failed = 0
+    pending = {}
+    queue = iter(todo)
+    try:
+        while True:
+            # Keep a few files per worker in flight so results stream out as they finish.
+            while len(pending) < 2 * max(1, args.workers):
+                item = next(queue, None)
+                if item is None:
+                    break
+                os.makedirs(os.path.dirname(item[1]), exist_ok=True)
+                pending[submit(item[0], item[1])] = item
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                input_path, output_path, signature = pending.pop(future)
+                done += 1
+                try:
+                    _, seconds = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{done}/{len(todo)}] FAILED {input_path}: {e}")
+                    continue
+                manifest[input_path] = dict(signature, output=output_path, seconds=round(seconds, 3))
+                print(f"[{done}/{len(todo)}] {input_path} -> {output_path} ({seconds:.2f} s)")
+                if done % MANIFEST_FLUSH_EVERY == 0:
+                    save_manifest(manifest_path, manifest)
+    except KeyboardInterrupt:
+        print("Interrupted; progress so far is kept in the manifest.")
+    finally:
+        save_manifest(manifest_path, manifest)
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    rate = (done - failed) / elapsed if elapsed > 0 else 0
+    print(f"Processed {done - failed} images ({failed} failed, {skipped} skipped) "
+          f"in {elapsed:.1f} s, {rate:.2f} images/s.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
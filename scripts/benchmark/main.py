@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Benchmarks the redaction scripts stage by stage on synthetic screenshots.
+
+Screenshots are rendered with cv2.putText at several resolutions and text
+densities, with secrets planted at known positions (labelled values, AWS and
+GitHub keys, long hex strings). Each script's process() is run on them with
+the shared stages wrapped in timers, so the report shows where the time goes
+(load, threshold, OCR, matching, classification, blur, encode) next to
+throughput, peak RSS and the fraction of planted secrets that got blurred.
+The kernel only keeps a high-water mark of RSS per process, so the peak RSS
+saved with each case is the peak of the whole run up to and including that
+case, not of the case alone.
+The OCR cache is bypassed so every run does the full work.
+
+Results can be saved with --json and compared against a previous run with
+--baseline to spot regressions.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import detect, encode, ocr, ocr_backend, preprocess, rawimage, redact, regions
+from common.worker import load_script
+
+SCRIPTS_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# Script directory -> parameters the benchmark passes to process().
+SCRIPTS = {
+    "secrets-handling": ["99", "30", "1"],
+    "secrets-handling-custom-keywords": ["99", "30", "password,name", "1"],
+    "ai-script": ["password,api key,token,secret", "99", "30"],
+}
+DEFAULT_SCRIPTS = "secrets-handling,secrets-handling-custom-keywords"
+STAGES = ("load", "threshold", "ocr", "match", "classify", "blur", "encode")
+
+WORDS = ("the quick brown fox jumps over lazy dog build deploy server status error warning config user "
+         "name email address project release branch commit merge request review open close file "
+         "folder window terminal output input value result update install").split()
+LABELS = ("Password", "API key", "Token", "Secret")
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.9
+FONT_THICKNESS = 2
+LINE_HEIGHT = 40
+# Fraction of text lines that carry a planted secret.
+SECRET_RATE = 0.15
+
+def random_token(rng, alphabet, length):
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+def random_secret(rng):
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "AKIA" + random_token(rng, string.ascii_uppercase + string.digits, 16)
+    if kind == 1:
+        return "ghp_" + random_token(rng, string.ascii_letters + string.digits, 36)
+    if kind == 2:
+        return random_token(rng, "0123456789abcdef", 40)
+    return None
+
+def draw_text(image, text, x, y):
+    """Draws text with its baseline at y and returns its (x, y, w, h) box."""
+    (w, h), baseline = cv2.getTextSize(text, FONT, FONT_SCALE, FONT_THICKNESS)
+    cv2.putText(image, text, (x, y), FONT, FONT_SCALE, (20, 20, 20), FONT_THICKNESS, cv2.LINE_AA)
+    return x, y - h, w, h + baseline
+
+def generate(width, height, density, seed=0):
+    """Returns (BGR image, list of planted secret boxes)."""
+    rng = random.Random(f"{width}x{height}:{density}:{seed}")
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    planted = []
+    for row in range(1, height // LINE_HEIGHT):
+        if rng.random() > density:
+            continue
+        x = rng.randint(20, max(20, width // 4))
+        y = row * LINE_HEIGHT
+        if rng.random() < SECRET_RATE:
+            secret = random_secret(rng)
+            if secret is None:
+                label_box = draw_text(image, rng.choice(LABELS) + ":", x, y)
+                secret = random_token(rng, string.ascii_letters + string.digits, rng.randint(12, 24))
+                x = label_box[0] + label_box[2] + 15
+            box = draw_text(image, secret, x, y)
+            if box[0] + box[2] < width:
+                planted.append(box)
+            continue
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10)))
+        draw_text(image, line, x, y)
+    return image, planted
+
+def recall(planted, blurred):
+    """Fraction of planted boxes whose centre lies inside a blurred box."""
+    if not planted:
+        return 1.0
+    hits = 0
+    for x, y, w, h in planted:
+        cx, cy = x + w / 2, y + h / 2
+        if any(bx <= cx < bx + bw and by <= cy < by + bh for bx, by, bw, bh in blurred):
+            hits += 1
+    return hits / len(planted)
+
+class StageTimer:
+    """Wraps functions the scripts call so the time spent in each is added to a stage.
+
+    Times are exclusive: a wrapped call made inside another (the threshold
+    inside OCR preprocessing) is taken off the outer stage, so the stages add
+    up to no more than the total.
+    """
+
+    def __init__(self):
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.blurred = []
+        self._patches = []
+        # Time spent in nested wrapped calls, one entry per wrapped call in progress.
+        self._nested = []
+
+    def patch(self, owner, name, stage, wrap=None):
+        original = getattr(owner, name)
+        call = wrap(original) if wrap else original
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            self._nested.append(0.0)
+            try:
+                return call(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.times[stage] += elapsed - self._nested.pop()
+                if self._nested:
+                    self._nested[-1] += elapsed
+        self._patches.append((owner, name, original))
+        setattr(owner, name, timed)
+
+    def restore(self):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+
+    def install(self, module):
+        # Bypass the OCR cache, or every run after the first would measure a cache hit.
+        self.patch(ocr, "image_to_data", "ocr",
+                   lambda f: lambda image, config="", use_cache=True, **kwargs: f(image, config, use_cache=False, **kwargs))
+        # Likewise for the region cache, which would skip OCR and matching altogether.
+        self.patch(regions, "load", "match", lambda f: lambda key: None)
+        self.patch(regions, "save", "match", lambda f: lambda key, found: None)
+        self.patch(preprocess, "apply_threshold", "threshold")
+        self.patch(detect.Detector, "detect", "match")
+        if hasattr(module, "find_keyword_boxes"):
+            self.patch(module, "find_keyword_boxes", "match")
+        if hasattr(module, "password_scores"):
+            self.patch(module, "password_scores", "classify")
+        def keep_boxes(f):
+            def blur(*args, **kwargs):
+                merged = f(*args, **kwargs)
+                self.blurred = merged
+                return merged
+            return blur
+        self.patch(redact, "blur_boxes", "blur", keep_boxes)
+
+def peak_rss_mb():
+    """Peak RSS so far of this process and of its waited-for children (Tesseract), in MB; never decreases."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+def run_case(module, params, input_path, output_path, planted):
+    timer = StageTimer()
+    timer.install(module)
+    try:
+        started = time.perf_counter()
+        image = rawimage.imread(input_path)
+        timer.times["load"] = time.perf_counter() - started
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = module.process(image, list(params))
+            if result is None:
+                result = image
+            encode_started = time.perf_counter()
+            encode.imwrite(output_path, result, "final")
+            timer.times["encode"] = time.perf_counter() - encode_started
+        total = time.perf_counter() - started
+    finally:
+        timer.restore()
+    return timer.times, total, recall(planted, timer.blurred)
+
+def parse_sizes(value):
+    return [tuple(int(n) for n in size.lower().split("x")) for size in value.split(",") if size]
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the redaction scripts on synthetic screenshots.")
+    parser.add_argument("--scripts", default=DEFAULT_SCRIPTS,
+                        help=f"comma-separated script directories, or 'all' (default: {DEFAULT_SCRIPTS})")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1280x720,1920x1080,3840x2160"))
+    parser.add_argument("--densities", default="0.3,0.9", help="fraction of text lines filled")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ocr-backend", choices=ocr_backend.BACKENDS,
+                        help="OCR engine to benchmark (default: the [OCR] backend setting)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --json")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if args.ocr_backend:
+        ocr_backend.configure(args.ocr_backend)
+    names = list(SCRIPTS) if args.scripts == "all" else [s.strip() for s in args.scripts.split(",") if s.strip()]
+    densities = [float(d) for d in args.densities.split(",") if d]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = {r["case"]: r for r in json.load(f)["results"]}
+
+    results = []
+    header = f"{'case':<52}" + "".join(f"{stage:>10}" for stage in STAGES) + f"{'total':>10}{'MP/s':>8}{'recall':>8}"
+    print(f"Stage latencies are medians in milliseconds, excluding nested stages; OCR backend: {ocr_backend.get_backend().name}.")
+    print(header)
+    with tempfile.TemporaryDirectory(prefix="smartscreenshot-bench-") as tmp:
+        for name in names:
+            if name not in SCRIPTS:
+                print(f"Unknown script '{name}'; choose from {', '.join(SCRIPTS)}.")
+                continue
+            module = load_script(os.path.join(SCRIPTS_ROOT, name, "main.py"))
+            for width, height in args.sizes:
+                for density in densities:
+                    image, planted = generate(width, height, density, args.seed)
+                    input_path = os.path.join(tmp, f"input-{width}x{height}-{density}.png")
+                    output_path = os.path.join(tmp, "output" + encode.extension("final"))
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        encode.imwrite(input_path, image, "temp")
+                    runs = [run_case(module, SCRIPTS[name], input_path, output_path, planted)
+                            for _ in range(max(1, args.repeat))]
+                    stages = {stage: statistics.median(r[0][stage] for r in runs) for stage in STAGES}
+                    total = statistics.median(r[1] for r in runs)
+                    case = f"{name} {width}x{height} d={density}"
+                    own_rss, child_rss = peak_rss_mb()
+                    result = {
+                        "case": case,
+                        "stages_ms": {stage: round(1000 * t, 2) for stage, t in stages.items()},
+                        "total_ms": round(1000 * total, 2),
+                        "megapixels_per_s": round(width * height / 1e6 / total, 3) if total else 0,
+                        "recall": round(min(r[2] for r in runs), 3),
+                        "planted": len(planted),
+                        # Peaks since the benchmark started, so a case shows at least the earlier cases' peaks.
+                        "cumulative_peak_rss_mb": round(own_rss, 1),
+                        "cumulative_peak_child_rss_mb": round(child_rss, 1),
+                    }
+                    results.append(result)
+                    print(f"{case:<52}" + "".join(f"{1000 * stages[stage]:>10.1f}" for stage in STAGES) +
+                          f"{result['total_ms']:>10.1f}{result['megapixels_per_s']:>8.2f}{result['recall']:>8.2f}")
+                    previous = baseline.get(case)
+                    if previous:
+                        change = 100 * (result["total_ms"] - previous["total_ms"]) / previous["total_ms"]
+                        print(f"{'':<52}vs baseline: total {change:+.1f}%, "
+                              f"recall {result['recall'] - previous['recall']:+.2f}")
+
+    own_rss, child_rss = peak_rss_mb()
+    print(f"Peak RSS: {own_rss:.0f} MB (benchmark), {child_rss:.0f} MB (largest OCR subprocess).")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "peak_rss_mb": round(own_rss, 1),
+                       "peak_child_rss_mb": round(child_rss, 1)}, f, indent=2)
+        print(f"Results saved as '{args.json}'.")
+
+if __name__ == "__main__":
+    main()
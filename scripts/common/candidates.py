@@ -0,0 +1,84 @@
+"""Cheap pre-filter for OCR tokens before they reach an expensive classifier.
+
+Most tokens on a screenshot are short words, numbers or punctuation that can
+never be a secret. CandidateFilter drops those with a few string checks and
+counts why each token was skipped.
+"""
+import collections
+import math
+import string
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing done down during each edit else every file few for from further get go had
+has have having he help her here hers him his how i if in into is it its just like make me more most my new no
+nor not now of off on once only open or other our ours out over own same save see she should so some such than
+that the their theirs them then there these they this those through to too under until up us use very view
+was we were what when where which while who whom why will with would yes you your yours
+""".split())
+
+def load_stopwords(path):
+    """Reads extra stopwords, separated by whitespace, from a file; an unreadable file adds none."""
+    try:
+        with open(path, "r") as f:
+            return frozenset(word.lower() for word in f.read().split())
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Warning: could not read stopword file {path}: {e}")
+        return frozenset()
+
+def shannon_entropy(text):
+    """Bits per character of the token's character distribution."""
+    counts = collections.Counter(text)
+    length = len(text)
+    return -sum(n / length * math.log2(n / length) for n in counts.values())
+
+def char_classes(text):
+    classes = 0
+    classes += any(c.islower() for c in text)
+    classes += any(c.isupper() for c in text)
+    classes += any(c.isdigit() for c in text)
+    classes += any(not c.isalnum() for c in text)
+    return classes
+
+class CandidateFilter:
+    """Keeps tokens long, varied and unusual enough to be worth classifying.
+
+    Set a threshold to 0 to disable that check. ``min_char_classes`` counts
+    lowercase, uppercase, digits and symbols, so plain words and numbers need
+    at least two classes to survive with the default of 2.
+    """
+
+    def __init__(self, min_length=6, min_entropy=2.0, min_char_classes=2, stopwords=STOPWORDS):
+        self.min_length = min_length
+        self.min_entropy = min_entropy
+        self.min_char_classes = min_char_classes
+        self.stopwords = stopwords
+
+    def skip_reason(self, text):
+        """Returns why the token is benign, or None if it should be classified."""
+        word = text.strip(string.punctuation)
+        if not any(c.isalnum() for c in word):
+            return "punctuation"
+        if len(word) < self.min_length:
+            return "short"
+        if word.lower() in self.stopwords:
+            return "stopword"
+        if word.isdigit():
+            return "number"
+        if char_classes(word) < self.min_char_classes:
+            return "plain word"
+        if shannon_entropy(word) < self.min_entropy:
+            return "low entropy"
+        return None
+
+    def filter(self, texts):
+        """Returns (kept texts, Counter of skip reasons)."""
+        kept = []
+        skipped = collections.Counter()
+        for text in texts:
+            reason = self.skip_reason(text)
+            if reason is None:
+                kept.append(text)
+            else:
+                skipped[reason] += 1
+        return kept, skipped
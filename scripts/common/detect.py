@@ -0,0 +1,95 @@
+"""Sensitive label, keyword and secret pattern matching shared by the scripts.
+
+Labels and keywords are compiled into a single trie-shaped regular expression
+(shared prefixes are factored out, so "pass", "password" and "pwd" cost one
+branch on "p"), and the secret patterns into one alternation with a named
+group per rule. Each token is therefore scanned once per list no matter how
+many entries the list has, and the match tells which rule fired.
+"""
+import re
+
+SENSITIVE_LABELS = ["password", "api key", "secret", "token", "pwd", "pass", "credential", "key"]
+
+# When several rules match at the same position the first one is reported,
+# so the more specific rules come first.
+SECRET_PATTERNS = {
+    "jwt": r'eyJ[A-Za-z0-9-_]+\.eyJ[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+',
+    "hex": r'[a-fA-F0-9]{32,}',
+    "long_token": r'[A-Za-z0-9-_]{20,}',
+    "base64": r'[A-Za-z0-9+/]{20,}=*',
+}
+
+def literal_pattern(words):
+    """Builds a regex source matching any of the words, preferring the longest."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        ends_here = "" in node
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if ends_here else "")
+
+    return build(trie)
+
+def compile_literals(words):
+    """Returns a compiled matcher for the lowercased words, or None if there are none."""
+    words = sorted({w.strip().lower() for w in words if w.strip()})
+    if not words:
+        return None
+    return re.compile(literal_pattern(words))
+
+def compile_patterns(patterns):
+    """Combines {rule name: regex} into one regex with a named group per rule."""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?P<{name}>{source})" for name, source in patterns.items()))
+
+class Detector:
+    """Matches OCR tokens against labels/keywords and secret patterns.
+
+    ``anchored`` makes the secret patterns match at the start of the token
+    (re.match) instead of anywhere in it (re.search).
+    """
+
+    def __init__(self, labels=SENSITIVE_LABELS, patterns=SECRET_PATTERNS, anchored=False):
+        self.labels = compile_literals(labels)
+        self.patterns = compile_patterns(patterns)
+        self.anchored = anchored
+
+    def match_label(self, text):
+        """Returns the label found in the token (case-insensitive), or None."""
+        if self.labels is None:
+            return None
+        m = self.labels.search(text.lower())
+        return m.group(0) if m else None
+
+    def match_secret(self, text):
+        """Returns the name of the secret pattern that matched, or None."""
+        if self.patterns is None:
+            return None
+        m = self.patterns.match(text) if self.anchored else self.patterns.search(text)
+        return m.lastgroup if m else None
+
+    def detect(self, text):
+        """Returns ("label", label), ("secret", rule name) or None."""
+        label = self.match_label(text)
+        if label is not None:
+            return "label", label
+        rule = self.match_secret(text)
+        if rule is not None:
+            return "secret", rule
+        return None
+
+    def fingerprint(self):
+        """Identifies the rules, so results cached under it go stale when they change."""
+        labels = self.labels.pattern if self.labels else ""
+        patterns = self.patterns.pattern if self.patterns else ""
+        return f"{labels}|{patterns}|{self.anchored}"
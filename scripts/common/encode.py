@@ -0,0 +1,130 @@
+"""Image encoding settings shared by the GTK app and the scripts.
+
+The [Output] section of smartscreenshot.ini picks a format and compression
+level per purpose: "final" for files the user keeps (captures, saved and
+script output) and "temp" for intermediates that are thrown away (viewer
+previews, input for legacy scripts). Every encode reports its time and size.
+
+Supported formats are png (compression 0-9), webp (always lossless) and bmp
+(uncompressed, the fastest to write).
+"""
+import configparser
+import os
+import time
+
+from common import trace
+
+FORMATS = {"png": ".png", "webp": ".webp", "bmp": ".bmp"}
+DEFAULTS = {
+    "final": {"format": "png", "compression": 9},
+    "temp": {"format": "png", "compression": 1},
+}
+PURPOSE_ENV = "SMARTSCREENSHOT_OUTPUT_PURPOSE"
+CONFIG_ENV = "SMARTSCREENSHOT_CONFIG"
+
+_settings = None
+_warned_purposes = set()
+
+def default_config_path():
+    return os.environ.get(CONFIG_ENV) or os.path.join(
+        os.path.expanduser("~"), ".config", "smartscreenshot", "smartscreenshot.ini")
+
+def load_settings(config=None):
+    """Returns {purpose: {"format", "compression"}} from a ConfigParser or the default ini."""
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(default_config_path())
+    section = config["Output"] if config.has_section("Output") else {}
+    settings = {}
+    for purpose, defaults in DEFAULTS.items():
+        fmt = section.get(f"{purpose}_format", defaults["format"]).strip().lower()
+        if fmt not in FORMATS:
+            print(f"Unknown {purpose}_format '{fmt}', using {defaults['format']}.")
+            fmt = defaults["format"]
+        try:
+            compression = min(9, max(0, int(section.get(f"{purpose}_compression", defaults["compression"]))))
+        except ValueError:
+            compression = defaults["compression"]
+        settings[purpose] = {"format": fmt, "compression": compression}
+    return settings
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+def default_purpose():
+    purpose = os.environ.get(PURPOSE_ENV, "final").strip().lower() or "final"
+    if purpose not in DEFAULTS:
+        if purpose not in _warned_purposes:
+            _warned_purposes.add(purpose)
+            print(f"Unknown {PURPOSE_ENV} '{purpose}', using final.")
+        return "final"
+    return purpose
+
+def extension(purpose, settings=None):
+    settings = settings or get_settings()
+    return FORMATS[settings[purpose]["format"]]
+
+def format_for_path(path, purpose, settings=None):
+    """The format implied by the file extension, else the configured one for the purpose."""
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    settings = settings or get_settings()
+    return settings[purpose]["format"]
+
+def report(path, fmt, started, verbose=True):
+    elapsed = time.perf_counter() - started
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    trace.record("encode", time.time() - elapsed, elapsed, path=path, format=fmt, bytes=size)
+    if verbose:
+        print(f"Encoded '{path}' as {fmt} in {elapsed * 1000:.1f} ms ({size / 1024:.0f} KiB).")
+
+def cv2_params(fmt, compression):
+    import cv2
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    if fmt == "webp":
+        # Quality above 100 selects lossless WebP in OpenCV.
+        return [cv2.IMWRITE_WEBP_QUALITY, 101]
+    return []
+
+def imwrite(path, image, purpose=None, settings=None, verbose=True):
+    """cv2.imwrite with the configured compression for the purpose."""
+    import cv2
+    purpose = purpose or default_purpose()
+    settings = settings or get_settings()
+    fmt = format_for_path(path, purpose, settings)
+    started = time.perf_counter()
+    ok = cv2.imwrite(path, image, cv2_params(fmt, settings[purpose]["compression"]))
+    report(path, fmt, started, verbose)
+    return ok
+
+def save_pixbuf(pixbuf, path, purpose, settings=None):
+    """Saves a GdkPixbuf. WebP goes through OpenCV, since the GdkPixbuf saver is not lossless."""
+    settings = settings or get_settings()
+    fmt = format_for_path(path, purpose, settings)
+    compression = settings[purpose]["compression"]
+    started = time.perf_counter()
+    if fmt == "png":
+        pixbuf.savev(path, "png", ["compression"], [str(compression)])
+    elif fmt == "bmp":
+        pixbuf.savev(path, "bmp", [], [])
+    else:
+        import cv2
+        import numpy as np
+        width, height, channels = pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_n_channels()
+        stride = pixbuf.get_rowstride()
+        data = pixbuf.read_pixel_bytes().get_data()
+        rows = np.frombuffer(data + b"\0" * (height * stride - len(data)), dtype=np.uint8).reshape(height, stride)
+        pixels = rows[:, :width * channels].reshape(height, width, channels)
+        code = cv2.COLOR_RGBA2BGRA if channels == 4 else cv2.COLOR_RGB2BGR
+        if not cv2.imwrite(path, cv2.cvtColor(pixels, code), cv2_params(fmt, compression)):
+            raise OSError(f"could not write '{path}'")
+    report(path, fmt, started)
@@ -0,0 +1,66 @@
+"""Line index over OCR output, used to find the value written next to a label.
+
+Words are grouped by Tesseract's (block_num, par_num, line_num) once, so the
+tokens to the right of a label are a dict lookup away. When a label ends its
+Tesseract line (e.g. the value was OCRed as a separate block), the visual row
+is searched instead through a list of words sorted by top, using bisect.
+"""
+import bisect
+
+LINE_KEYS = ("block_num", "par_num", "line_num")
+
+class LineIndex:
+    def __init__(self, data, y_tolerance=10):
+        self.data = data
+        self.y_tolerance = y_tolerance
+        texts, tops, lefts = data["text"], data["top"], data["left"]
+        words = [i for i, text in enumerate(texts) if text.strip()]
+
+        self._by_top = sorted(words, key=lambda i: tops[i])
+        self._tops = [tops[i] for i in self._by_top]
+
+        self._line_of = {}
+        if all(key in data for key in LINE_KEYS):
+            lines = {}
+            for i in words:
+                lines.setdefault(tuple(data[key][i] for key in LINE_KEYS), []).append(i)
+            for members in lines.values():
+                members.sort(key=lambda i: lefts[i])
+                for position, i in enumerate(members):
+                    self._line_of[i] = (members, position)
+
+    def same_row(self, i):
+        """Words whose top is within y_tolerance of word i's top, excluding i."""
+        top = self.data["top"][i]
+        start = bisect.bisect_right(self._tops, top - self.y_tolerance)
+        end = bisect.bisect_left(self._tops, top + self.y_tolerance)
+        return [j for j in self._by_top[start:end] if j != i]
+
+    def right_of(self, i):
+        """Words to the right of word i on its line, nearest first."""
+        if i in self._line_of:
+            members, position = self._line_of[i]
+            if position + 1 < len(members):
+                return members[position + 1:]
+        lefts = self.data["left"]
+        return sorted((j for j in self.same_row(i) if lefts[j] > lefts[i]), key=lambda j: lefts[j])
+
+    def values_right_of(self, i, max_tokens=1, max_gap=None):
+        """Up to max_tokens words following label i, stopping at a horizontal gap wider than max_gap.
+
+        The gap check only applies between value words, never between the label and
+        the first value. max_gap defaults to twice the label's height.
+        """
+        lefts, widths = self.data["left"], self.data["width"]
+        if max_gap is None:
+            max_gap = 2 * self.data["height"][i]
+        values = []
+        for j in self.right_of(i):
+            if values:
+                previous = values[-1]
+                if lefts[j] - (lefts[previous] + widths[previous]) > max_gap:
+                    break
+            values.append(j)
+            if len(values) >= max_tokens:
+                break
+        return values
@@ -0,0 +1,192 @@
+"""Shared OCR layer for the scripts.
+
+image_to_data() returns the same dict as
+``pytesseract.image_to_data(..., output_type=pytesseract.Output.DICT)`` and
+caches it by a hash of the pixels plus the Tesseract config. Results are kept
+in a small in-memory LRU and as JSON files under ~/.cache/smartscreenshot/ocr,
+so re-running a script with different blur settings skips Tesseract.
+
+Tesseract itself is reached through the engine configured in ocr_backend.py,
+either the tesseract command line or an in-process API.
+
+Callers can pass preprocessing options (see preprocess.py); they become part
+of the cache key and replace the plain Tesseract call on a miss.
+
+Large frames are OCRed as overlapping horizontal bands in parallel. Each band
+owns a "core" range of rows; a word is kept only by the band whose core holds
+its vertical centre, which removes the duplicates from the overlaps.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import ocr_backend, trace
+
+CACHE_DIR = os.environ.get("SMARTSCREENSHOT_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "smartscreenshot"))
+OCR_CACHE_DIR = os.path.join(CACHE_DIR, "ocr")
+MEMORY_ENTRIES = 16
+DISK_LIMIT_BYTES = 64 * 1024 * 1024
+
+# Frames with fewer pixels than this are OCRed in a single call.
+TILE_MIN_PIXELS = 2_000_000
+# Bands are never made shorter than this, so a frame gets at most height // MIN_BAND_HEIGHT bands.
+MIN_BAND_HEIGHT = 300
+# Rows shared by neighbouring bands; must be taller than a line of text.
+BAND_OVERLAP = 80
+TILE_WORKERS = int(os.environ.get("SMARTSCREENSHOT_OCR_WORKERS", "0")) or os.cpu_count() or 1
+# Block numbers of band i are offset by i * BLOCK_STRIDE to stay unique after merging.
+BLOCK_STRIDE = 1000
+
+DATA_KEYS = ocr_backend.TSV_KEYS
+
+_memory = collections.OrderedDict()
+_lock = threading.Lock()
+
+def image_hash(image, config=""):
+    import numpy as np
+    pixels = image if image.flags.c_contiguous else np.ascontiguousarray(image)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{pixels.shape}:{pixels.dtype}:{config}".encode())
+    h.update(pixels.data)
+    return h.hexdigest()
+
+def _disk_path(key):
+    return os.path.join(OCR_CACHE_DIR, key + ".json")
+
+def _read_disk(key):
+    path = _disk_path(key)
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Bump the mtime so eviction drops the least recently used entries first.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+def _write_disk(key, data):
+    # OCR output can contain the very secrets being redacted, so keep it private.
+    os.makedirs(OCR_CACHE_DIR, mode=0o700, exist_ok=True)
+    path = _disk_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _evict_disk()
+
+def _evict_disk():
+    entries = []
+    total = 0
+    for entry in os.scandir(OCR_CACHE_DIR):
+        if entry.name.endswith(".json"):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= DISK_LIMIT_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def _remember(key, data):
+    with _lock:
+        _memory[key] = data
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+def empty_data():
+    return {key: [] for key in DATA_KEYS}
+
+def tesseract_data(image, config=""):
+    backend = ocr_backend.get_backend()
+    with trace.span("tesseract", width=image.shape[1], height=image.shape[0], backend=backend.name):
+        return backend.image_to_data(image, config)
+
+def split_bands(height, band_count, overlap=BAND_OVERLAP):
+    """Returns (core_top, core_bottom, top, bottom) row ranges for each band."""
+    band_height = -(-height // band_count)
+    bands = []
+    for core_top in range(0, height, band_height):
+        core_bottom = min(height, core_top + band_height)
+        bands.append((core_top, core_bottom, max(0, core_top - overlap), min(height, core_bottom + overlap)))
+    return bands
+
+def merge_bands(results, bands):
+    merged = {}
+    for band_index, (data, (core_top, core_bottom, top, _)) in enumerate(zip(results, bands)):
+        for key in data:
+            merged.setdefault(key, [])
+        for i in range(len(data["text"])):
+            word_top = data["top"][i] + top
+            if not core_top <= word_top + data["height"][i] / 2 < core_bottom:
+                continue
+            for key, values in data.items():
+                value = values[i]
+                if key == "top":
+                    value = word_top
+                elif key == "block_num":
+                    value += band_index * BLOCK_STRIDE
+                merged[key].append(value)
+    return merged
+
+def run_tesseract(image, config=""):
+    height, width = image.shape[:2]
+    band_count = min(TILE_WORKERS, height // MIN_BAND_HEIGHT)
+    if width * height < TILE_MIN_PIXELS or band_count < 2:
+        return tesseract_data(image, config)
+    # Bands run in parallel; keep each Tesseract from oversubscribing cores with OpenMP threads.
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    bands = split_bands(height, band_count)
+    with ThreadPoolExecutor(max_workers=len(bands)) as executor:
+        results = list(executor.map(lambda band: tesseract_data(image[band[2]:band[3]], config), bands))
+    return merge_bands(results, bands)
+
+def image_to_data(image, config="", use_cache=True, options=None):
+    with trace.span("ocr", width=image.shape[1], height=image.shape[0]) as details:
+        if not use_cache:
+            return options.run(image, config) if options else run_tesseract(image, config)
+        data, details["cache"] = _cached_image_to_data(image, config, options)
+        return data
+
+def _cached_image_to_data(image, config, options):
+    """Returns (data, "memory" | "disk" | "miss")."""
+    variant = f"{ocr_backend.get_backend().name}|{config}" + (f"|{options.key()}" if options else "")
+    key = image_hash(image, variant)
+    with _lock:
+        data = _memory.get(key)
+        if data is not None:
+            _memory.move_to_end(key)
+            return data, "memory"
+    data = _read_disk(key)
+    source = "disk"
+    if data is None:
+        source = "miss"
+        data = options.run(image, config) if options else run_tesseract(image, config)
+        try:
+            _write_disk(key, data)
+        except (OSError, TypeError, ValueError) as e:
+            print("Warning: could not write OCR cache:", e)
+    else:
+        print("Using cached OCR result.")
+    _remember(key, data)
+    return data, source
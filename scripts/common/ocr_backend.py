@@ -0,0 +1,166 @@
+"""OCR engines behind ocr.image_to_data().
+
+``pytesseract`` (the default) runs the tesseract binary for every call, which
+means a process start, a temporary image file and TSV parsing each time.
+``tesserocr`` calls libtesseract in-process and keeps its initialised APIs
+between calls, so only the recognition itself is paid for; it matters most in
+long-lived processes such as the hotkey daemon and the app's workers. Both
+return the pytesseract ``Output.DICT`` layout.
+
+The engine is chosen with ``backend`` in the [OCR] section of
+smartscreenshot.ini or the SMARTSCREENSHOT_OCR_BACKEND environment variable.
+tesserocr is optional; without it the pytesseract engine is used.
+"""
+import configparser
+import os
+import shlex
+import threading
+
+from common import trace
+
+BACKEND_ENV = "SMARTSCREENSHOT_OCR_BACKEND"
+BACKENDS = ("pytesseract", "tesserocr")
+# Columns of Tesseract's TSV output, in order; all but "text" are numbers.
+TSV_KEYS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+            "left", "top", "width", "height", "conf", "text")
+# The resolution the tesseract command line assumes for images without one.
+DEFAULT_DPI = 70
+
+_lock = threading.Lock()
+_backend = None
+
+def parse_tsv(tsv):
+    """Parses TSV rows without a header the way pytesseract builds its DICT output."""
+    result = {key: [] for key in TSV_KEYS}
+    for line in tsv.splitlines():
+        if not line:
+            continue
+        cells = line.split("\t", len(TSV_KEYS) - 1)
+        cells += [""] * (len(TSV_KEYS) - len(cells))
+        for key, cell in zip(TSV_KEYS, cells):
+            if key != "text":
+                try:
+                    cell = int(float(cell))
+                except ValueError:
+                    pass
+            result[key].append(cell)
+    return result
+
+def parse_config(config):
+    """Splits Tesseract command line options into (lang, psm, oem, {variable: value})."""
+    lang, psm, oem, variables = None, None, None, {}
+    args = shlex.split(config)
+    i = 0
+    while i < len(args):
+        arg, value = args[i], args[i + 1] if i + 1 < len(args) else None
+        if arg in ("--psm", "--oem", "-l", "-c") and value is not None:
+            if arg == "--psm":
+                psm = int(value)
+            elif arg == "--oem":
+                oem = int(value)
+            elif arg == "-l":
+                lang = value
+            elif "=" in value:
+                name, _, setting = value.partition("=")
+                variables[name] = setting
+            i += 2
+            continue
+        print(f"Ignoring unsupported Tesseract option '{arg}'")
+        i += 1
+    return lang, psm, oem, variables
+
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def image_to_data(self, image, config=""):
+        import pytesseract
+        return pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+
+class TesserocrBackend:
+    """Keeps initialised tesserocr APIs, one per set of options, for reuse by any thread.
+
+    An API is not thread-safe, so each call takes an idle one (or makes a new
+    one) and puts it back afterwards.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self.tesserocr = tesserocr
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        lang, psm, oem, variables = key
+        kwargs = {"lang": lang or "eng", "init": True}
+        if psm is not None:
+            kwargs["psm"] = psm
+        if oem is not None:
+            kwargs["oem"] = oem
+        with trace.span("ocr_init", backend=self.name):
+            api = self.tesserocr.PyTessBaseAPI(**kwargs)
+            for name, value in variables:
+                api.SetVariable(name, value)
+        return api
+
+    def _release(self, key, api):
+        with self._lock:
+            self._idle.setdefault(key, []).append(api)
+
+    def image_to_data(self, image, config=""):
+        import numpy as np
+        lang, psm, oem, variables = parse_config(config)
+        key = (lang, psm, oem, tuple(sorted(variables.items())))
+        pixels = np.ascontiguousarray(image)
+        height, width = pixels.shape[:2]
+        channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+        api = self._acquire(key)
+        try:
+            api.SetImageBytes(pixels.tobytes(), width, height, channels, width * channels)
+            api.SetSourceResolution(DEFAULT_DPI)
+            api.Recognize()
+            return parse_tsv(api.GetTSVText(0))
+        finally:
+            api.Clear()
+            self._release(key, api)
+
+def load_name(config=None):
+    """The configured backend name, from the environment, else the [OCR] section."""
+    name = os.environ.get(BACKEND_ENV)
+    if name is None:
+        if config is None:
+            from common import encode
+            config = configparser.ConfigParser()
+            config.read(encode.default_config_path())
+        name = config.get("OCR", "backend", fallback="")
+    name = name.strip().lower() or "pytesseract"
+    if name not in BACKENDS:
+        print(f"Unknown OCR backend '{name}'; using pytesseract.")
+        return "pytesseract"
+    return name
+
+def create(name):
+    if name == "tesserocr":
+        try:
+            return TesserocrBackend()
+        except ImportError:
+            print("tesserocr is not installed; using pytesseract.")
+    return PytesseractBackend()
+
+def configure(name):
+    """Sets the backend for this process and for processes it starts."""
+    global _backend
+    os.environ[BACKEND_ENV] = name
+    with _lock:
+        _backend = None
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = create(load_name())
+        return _backend
@@ -0,0 +1,212 @@
+"""OCR preprocessing shared by the scripts.
+
+Screenshots are mostly empty space, pictures and UI chrome. Instead of
+handing the whole frame to Tesseract, likely text lines are located first
+(morphological gradient, Otsu threshold, a horizontal closing and connected
+components), cropped, scaled so the text is about TEXT_HEIGHT pixels tall,
+and packed one below the other onto a single white canvas. The canvas is
+OCRed in one call, which keeps one Tesseract start-up per frame, and the word
+boxes are mapped back to the original frame. Crops of light-on-dark text are
+inverted on the way.
+
+The search errs towards OCRing too much. A component too tall to be a single
+line is kept as a region of its own when it looks like text (dense text
+whose lines ran together, or very large text): wide enough and filled enough.
+Narrow or hollow ones (dividers, scrollbars, panel borders) are ignored. When
+nothing is found at all, the whole frame is OCRed, so text is never skipped
+unread.
+
+Thresholding and the page segmentation mode are per-script choices. Defaults
+come from the script and can be overridden in smartscreenshot.ini, in [OCR]
+for every script or in [OCR <script directory>] for one, e.g.::
+
+    [OCR ai-script]
+    threshold = adaptive
+    psm = 6
+"""
+import bisect
+import configparser
+
+from common import ocr, redact, trace
+
+THRESHOLDS = ("none", "adaptive", "otsu")
+# Height text is scaled to before OCR; Tesseract is most accurate around 30 px capitals.
+TEXT_HEIGHT = 32
+MIN_SCALE = 0.5
+MAX_SCALE = 3.0
+# Connected components outside these bounds (in pixels) are not text lines.
+MIN_LINE_HEIGHT = 6
+MAX_LINE_HEIGHT = 120
+MIN_LINE_WIDTH = 8
+# Taller components are OCRed as blocks when at least this wide and this much filled; otherwise they are UI chrome.
+MIN_BLOCK_WIDTH = 32
+MIN_BLOCK_FILL = 0.25
+# Padding around each text region and the gap under which regions are merged.
+REGION_PAD = 4
+REGION_GAP = 8
+# White space between regions on the canvas and on its left and right.
+SLOT_GAP = 16
+CANVAS_MARGIN = 16
+# Above this share of the frame, OCRing the whole frame is cheaper than packing.
+MAX_COVERAGE = 0.6
+# Block numbers of region i are offset by i * REGION_BLOCK_STRIDE, above the offsets of tiled OCR.
+REGION_BLOCK_STRIDE = 1000 * ocr.BLOCK_STRIDE
+
+class OcrOptions:
+    def __init__(self, threshold="none", psm=None, oem=None, regions=True, text_height=TEXT_HEIGHT):
+        self.threshold = threshold if threshold in THRESHOLDS else "none"
+        self.psm = psm
+        self.oem = oem
+        self.regions = regions
+        self.text_height = text_height
+
+    def config(self):
+        """The Tesseract command line options."""
+        parts = []
+        if self.oem is not None:
+            parts.append(f"--oem {self.oem}")
+        if self.psm is not None:
+            parts.append(f"--psm {self.psm}")
+        return " ".join(parts)
+
+    def key(self):
+        """Identifies the options in the OCR cache key."""
+        return f"threshold={self.threshold};regions={self.regions};text_height={self.text_height}"
+
+    def run(self, image, config):
+        """OCRs image with these options; the result is in image coordinates."""
+        import cv2
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if not self.regions:
+            return ocr.run_tesseract(apply_threshold(gray, self.threshold), config)
+        with trace.span("text_regions") as details:
+            regions, heights, blocks = find_text_regions(gray)
+            coverage = sum(w * h for _, _, w, h in regions) / float(gray.shape[0] * gray.shape[1])
+            details["regions"], details["coverage"], details["blocks"] = len(regions), round(coverage, 3), blocks
+        if not regions or coverage > MAX_COVERAGE:
+            if not regions:
+                print("No text lines found; OCRing the whole frame.")
+            return ocr.run_tesseract(apply_threshold(gray, self.threshold), config)
+        scale = text_scale(heights, self.text_height)
+        canvas, slots = pack_regions(gray, regions, scale)
+        print(f"OCR on {len(regions)} text regions ({blocks} multi-line blocks) covering {100 * coverage:.0f}% of the frame (scale {scale:.2f}).")
+        data = ocr.run_tesseract(apply_threshold(canvas, self.threshold), config)
+        return unpack_data(data, slots, scale)
+
+def apply_threshold(gray, threshold):
+    import cv2
+    if threshold == "none":
+        return gray
+    with trace.span("threshold", method=threshold):
+        if threshold == "adaptive":
+            return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+def find_text_regions(gray):
+    """Returns (padded, merged region boxes, heights of the text lines found, count of multi-line blocks)."""
+    import cv2
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, edges = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # Join the letters of a line into one component.
+    lines = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(lines, connectivity=8)
+    height, width = gray.shape[:2]
+    boxes, heights = [], []
+    blocks = 0
+    for x, y, w, h, area in stats[1:count].tolist():
+        if w < MIN_LINE_WIDTH or h < MIN_LINE_HEIGHT:
+            continue
+        if h > MAX_LINE_HEIGHT:
+            if w < MIN_BLOCK_WIDTH or area < MIN_BLOCK_FILL * w * h:
+                continue
+            # Lines that ran together, or very large text; OCRed whole, but not used to pick the scale.
+            blocks += 1
+        else:
+            heights.append(h)
+        boxes.append(redact.expand_box(x, y, w, h, REGION_PAD, width, height))
+    return redact.merge_boxes(boxes, REGION_GAP), heights, blocks
+
+def text_scale(heights, text_height=TEXT_HEIGHT):
+    if not heights:
+        return 1.0
+    heights = sorted(heights)
+    median = heights[len(heights) // 2]
+    scale = min(MAX_SCALE, max(MIN_SCALE, text_height / float(median)))
+    # Close enough; resizing would cost more than it gains.
+    return 1.0 if 0.9 <= scale <= 1.1 else scale
+
+def pack_regions(gray, regions, scale):
+    """Stacks the scaled regions on a white canvas. Returns (canvas, [(canvas top, region)])."""
+    import cv2
+    import numpy as np
+    regions = sorted(regions, key=lambda r: (r[1], r[0]))
+    crops = []
+    for x, y, w, h in regions:
+        crop = gray[y:y+h, x:x+w]
+        if crop.mean() < 128:
+            crop = 255 - crop
+        if scale != 1.0:
+            interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+            crop = cv2.resize(crop, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=interpolation)
+        crops.append(crop)
+    width = max(crop.shape[1] for crop in crops) + 2 * CANVAS_MARGIN
+    height = sum(crop.shape[0] for crop in crops) + SLOT_GAP * (len(crops) + 1)
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    slots = []
+    top = SLOT_GAP
+    for crop, region in zip(crops, regions):
+        canvas[top:top + crop.shape[0], CANVAS_MARGIN:CANVAS_MARGIN + crop.shape[1]] = crop
+        slots.append((top, crop.shape[0], region))
+        top += crop.shape[0] + SLOT_GAP
+    return canvas, slots
+
+def unpack_data(data, slots, scale):
+    """Maps OCR output on the canvas back to frame coordinates, one block range per region."""
+    tops = [slot[0] for slot in slots]
+    result = {key: [] for key in data}
+    for i in range(len(data["text"])):
+        centre = data["top"][i] + data["height"][i] / 2
+        index = bisect.bisect_right(tops, centre) - 1
+        if index < 0:
+            continue
+        slot_top, slot_height, (x, y, w, h) = slots[index]
+        if centre >= slot_top + slot_height:
+            continue
+        for key, values in data.items():
+            value = values[i]
+            # Plain ints, so the result stays JSON serialisable for the OCR cache.
+            if key == "left":
+                value = int(x + min(w, max(0, round((value - CANVAS_MARGIN) / scale))))
+            elif key == "top":
+                value = int(y + min(h, max(0, round((value - slot_top) / scale))))
+            elif key in ("width", "height"):
+                value = int(round(value / scale))
+            elif key == "block_num":
+                value = int(value + index * REGION_BLOCK_STRIDE)
+            result[key].append(value)
+    return result
+
+def load_options(script, **defaults):
+    """The script's OcrOptions: its defaults, overridden by [OCR] and then [OCR <script>] in the ini."""
+    from common import encode
+    config = configparser.ConfigParser()
+    config.read(encode.default_config_path())
+    values = dict(defaults)
+    for section in ("OCR", f"OCR {script}"):
+        if not config.has_section(section):
+            continue
+        for key in ("threshold", "psm", "oem", "text_height"):
+            value = config.get(section, key, fallback="").strip()
+            if not value:
+                continue
+            try:
+                values[key] = value.lower() if key == "threshold" else int(value)
+            except ValueError:
+                print(f"Ignoring invalid [{section}] {key} = {value}")
+        if config.has_option(section, "regions"):
+            values["regions"] = config.getboolean(section, "regions")
+    return OcrOptions(**values)
+
+def image_to_data(image, options, use_cache=True):
+    """ocr.image_to_data() with preprocessing; boxes are in image coordinates."""
+    return ocr.image_to_data(image, options.config(), use_cache, options=options)
@@ -0,0 +1,129 @@
+"""Raw pixel files used to hand frames between the GTK app and the scripts.
+
+A file is a 32-byte header (magic, width, height, stride, channels, channel
+order) followed by ``height * stride`` bytes of 8-bit pixels. Files go to
+/dev/shm when it exists, so a frame never goes through a PNG codec on its way
+to a script and back. Frames are unredacted captures, so they are kept in a
+directory only the user can enter and written with mode 0600. The header helpers only need the standard library; the
+ndarray helpers import numpy/cv2 when called.
+"""
+import os
+import stat
+import struct
+import tempfile
+import threading
+
+from common import trace
+
+MAGIC = b"SSRAW001"
+HEADER = struct.Struct("<8sIIIII4x")
+ORDER_RGB = 0
+ORDER_BGR = 1
+EXTENSION = ".raw"
+
+_private_dir = None
+_lock = threading.Lock()
+
+def shared_temp_dir():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+def is_private_dir(path):
+    """True for a real directory (not a symlink) owned by this user that nobody else can enter."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+def temp_dir():
+    """A 0700 directory of this user's under /dev/shm (or the temp dir) for frames."""
+    global _private_dir
+    with _lock:
+        if _private_dir is None or not is_private_dir(_private_dir):
+            base = shared_temp_dir()
+            path = os.path.join(base, f"smartscreenshot-{os.getuid()}")
+            try:
+                os.mkdir(path, 0o700)
+            except FileExistsError:
+                pass
+            # Someone else may have taken the name first; then use a fresh random directory.
+            _private_dir = path if is_private_dir(path) else tempfile.mkdtemp(prefix="smartscreenshot-", dir=base)
+        return _private_dir
+
+def temp_path(name):
+    return os.path.join(temp_dir(), f"{name}{EXTENSION}")
+
+def is_raw(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def read_header(path):
+    with open(path, "rb") as f:
+        magic, width, height, stride, channels, order = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a raw frame")
+    return {"width": width, "height": height, "stride": stride, "channels": channels, "order": order}
+
+def write_bytes(path, data, width, height, stride, channels, order=ORDER_RGB):
+    """Writes pixel rows as-is; a short last row (as GdkPixbuf stores it) is padded."""
+    missing = height * stride - len(data)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, height, stride, channels, order))
+        f.write(data)
+        if missing > 0:
+            f.write(b"\0" * missing)
+    os.replace(tmp_path, path)
+
+def read_bytes(path):
+    header = read_header(path)
+    with open(path, "rb") as f:
+        f.seek(HEADER.size)
+        data = f.read(header["height"] * header["stride"])
+    return header, data
+
+def imread(path):
+    """Returns a writable BGR ndarray, from a raw frame or any file cv2 can read."""
+    with trace.span("load", raw=is_raw(path)):
+        return _imread(path)
+
+def _imread(path):
+    import cv2
+    import numpy as np
+    if not is_raw(path):
+        return cv2.imread(path)
+    header = read_header(path)
+    width, height, channels = header["width"], header["height"], header["channels"]
+    rows = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER.size, shape=(height, header["stride"]))
+    pixels = rows[:, :width * channels].reshape(height, width, channels)
+    if channels == 1:
+        return cv2.cvtColor(pixels[:, :, 0], cv2.COLOR_GRAY2BGR)
+    if header["order"] == ORDER_RGB:
+        return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR if channels == 4 else cv2.COLOR_RGB2BGR)
+    if channels == 4:
+        return cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR)
+    return np.array(pixels)
+
+def imwrite(path, image, purpose=None):
+    """Writes an RGB raw frame for .raw paths and encodes anything else per the [Output] settings."""
+    import cv2
+    if not path.endswith(EXTENSION):
+        from common import encode
+        return encode.imwrite(path, image, purpose)
+    if image.ndim == 2:
+        rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    else:
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    height, width, channels = rgb.shape
+    write_bytes(path, rgb.tobytes(), width, height, width * channels, channels, ORDER_RGB)
+    return True
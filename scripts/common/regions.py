@@ -0,0 +1,107 @@
+"""Cache of the sensitive regions a script found in a frame.
+
+Re-running a script only to try another kernel size, sigma or style should
+not OCR and match the frame again. After detection the scripts store the
+boxes, with the rule that matched each one, as a small JSON file under
+~/.cache/smartscreenshot/regions. The key is a hash of the pixels plus
+everything that affects detection: the script, its detection parameters, the
+OCR options and backend, and the detector's rules. A run that finds its key
+only re-renders the cached boxes.
+
+A region is {"box": [x, y, w, h], "rule": "<kind>:<name>"}, where kind is
+"label", "value" (the words after a label), "secret" or "keyword". No OCR
+text is stored.
+"""
+import collections
+import json
+import os
+import threading
+
+from common import ocr, ocr_backend
+
+REGIONS_CACHE_DIR = os.path.join(ocr.CACHE_DIR, "regions")
+MEMORY_ENTRIES = 16
+DISK_LIMIT_BYTES = 8 * 1024 * 1024
+
+_memory = collections.OrderedDict()
+_lock = threading.Lock()
+
+def detection_key(image, script, detector, ocr_options, *params):
+    parts = [script, detector.fingerprint(), ocr_backend.get_backend().name,
+             ocr_options.config(), ocr_options.key()] + [str(p) for p in params]
+    return ocr.image_hash(image, "|".join(parts))
+
+def region(box, kind, name):
+    return {"box": [int(v) for v in box], "rule": f"{kind}:{name}"}
+
+def boxes(regions):
+    return [tuple(r["box"]) for r in regions]
+
+def _disk_path(key):
+    return os.path.join(REGIONS_CACHE_DIR, key + ".json")
+
+def load(key):
+    """Returns the cached regions for key, or None."""
+    with _lock:
+        regions = _memory.get(key)
+        if regions is not None:
+            _memory.move_to_end(key)
+            return regions
+    path = _disk_path(key)
+    try:
+        with open(path, "r") as f:
+            regions = json.load(f)["regions"]
+        os.utime(path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    _remember(key, regions)
+    return regions
+
+def save(key, regions):
+    _remember(key, regions)
+    try:
+        os.makedirs(REGIONS_CACHE_DIR, mode=0o700, exist_ok=True)
+        path = _disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"regions": regions}, f)
+        os.replace(tmp_path, path)
+        _evict_disk()
+    except OSError as e:
+        print("Warning: could not write region cache:", e)
+
+def _remember(key, regions):
+    with _lock:
+        _memory[key] = regions
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+def _evict_disk():
+    entries = []
+    total = 0
+    for entry in os.scandir(REGIONS_CACHE_DIR):
+        if entry.name.endswith(".json"):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= DISK_LIMIT_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def cached_regions(key, detect):
+    """Returns the regions for key, calling detect() and caching its result on a miss."""
+    regions = load(key)
+    if regions is not None:
+        print(f"Re-rendering {len(regions)} cached sensitive regions; OCR and matching skipped.")
+        return regions
+    regions = detect()
+    save(key, regions)
+    return regions
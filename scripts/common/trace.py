@@ -0,0 +1,112 @@
+"""Timing spans for the app and the scripts.
+
+Tracing is off unless a trace file is configured, through the
+SMARTSCREENSHOT_TRACE environment variable or ``file`` in the [Trace] section
+of smartscreenshot.ini. Each finished span is appended to the file as one JSON
+line ({"name", "ts", "dur_ms", "pid", "tid", "args"}), or, with
+``format = chrome``, as a Chrome trace event that chrome://tracing and
+Perfetto can open. The app exports its settings to the environment, so
+worker processes and scripts run by it write to the same file.
+"""
+import configparser
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "SMARTSCREENSHOT_TRACE"
+FORMAT_ENV = "SMARTSCREENSHOT_TRACE_FORMAT"
+FORMATS = ("jsonl", "chrome")
+
+_lock = threading.Lock()
+_settings = None
+
+def load_settings(config=None):
+    """Returns (path or None, format) from the environment, else from the [Trace] section."""
+    path = os.environ.get(TRACE_ENV)
+    fmt = os.environ.get(FORMAT_ENV)
+    if path is None:
+        if config is None:
+            from common import encode
+            config = configparser.ConfigParser()
+            config.read(encode.default_config_path())
+        path = config.get("Trace", "file", fallback="").strip()
+        fmt = fmt or config.get("Trace", "format", fallback="jsonl").strip().lower()
+    fmt = fmt if fmt in FORMATS else "jsonl"
+    return (os.path.expanduser(path) if path else None), fmt
+
+def configure(path, fmt="jsonl"):
+    """Sets the trace file for this process and for processes it starts; a falsy path turns tracing off."""
+    global _settings
+    _settings = (os.path.expanduser(path) if path else None), (fmt if fmt in FORMATS else "jsonl")
+    if _settings[0]:
+        os.environ[TRACE_ENV] = _settings[0]
+        os.environ[FORMAT_ENV] = _settings[1]
+    else:
+        os.environ.pop(TRACE_ENV, None)
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+def enabled():
+    return get_settings()[0] is not None
+
+def _write(line, path, fmt):
+    with _lock:
+        if fmt == "chrome":
+            # The JSON array format may be left unterminated, which lets processes append concurrently.
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write("[\n")
+            except FileExistsError:
+                pass
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with os.fdopen(fd, "a") as f:
+            f.write(line)
+
+def record(name, start, duration, **args):
+    """Writes a span that started at wall-clock time start and lasted duration seconds."""
+    path, fmt = get_settings()
+    if path is None:
+        return
+    if fmt == "chrome":
+        event = {"name": name, "ph": "X", "ts": round(start * 1e6), "dur": round(duration * 1e6),
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        line = json.dumps(event) + ",\n"
+    else:
+        event = {"name": name, "ts": round(start, 6), "dur_ms": round(duration * 1000, 3),
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        line = json.dumps(event) + "\n"
+    try:
+        _write(line, path, fmt)
+    except OSError as e:
+        print("Warning: could not write trace:", e)
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Times the block. Extra details can be added to the yielded dict while it runs."""
+    if not enabled():
+        yield args
+        return
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield args
+    finally:
+        record(name, start, time.perf_counter() - started, **args)
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
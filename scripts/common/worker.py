@@ -0,0 +1,134 @@
+"""Long-lived worker processes that keep scripts imported between runs.
+
+A script opts in by defining a top-level ``process(image, params)`` function
+that takes a BGR ndarray plus the list of parameter strings and returns the
+processed ndarray. Scripts without it are run the old way, one python3
+process per run.
+"""
+import ast
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from common import rawimage, trace
+
+# Script modules already imported in this worker, keyed by absolute path.
+_modules = {}
+
+def has_entry_point(script_path):
+    """Checks for a top-level process() without importing the script."""
+    try:
+        with open(script_path, "r") as f:
+            tree = ast.parse(f.read(), filename=script_path)
+    except (OSError, SyntaxError, ValueError):
+        return False
+    return any(isinstance(node, ast.FunctionDef) and node.name == "process" for node in tree.body)
+
+def load_script(script_path):
+    path = os.path.abspath(script_path)
+    mtime = os.path.getmtime(path)
+    cached = _modules.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    name = "smartscreenshot_script_" + hashlib.md5(path.encode()).hexdigest()[:12]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _modules[path] = (mtime, module)
+    return module
+
+def warm_script(script_path):
+    load_script(script_path)
+    return os.getpid()
+
+def run_script(script_path, input_path, output_path, params):
+    """Runs process() on a raw frame or image file and writes the result the same way."""
+    with trace.span("run_script", script=os.path.basename(os.path.dirname(script_path))):
+        module = load_script(script_path)
+        image = rawimage.imread(input_path)
+        if image is None:
+            raise ValueError(f"Could not read the image file '{input_path}'")
+        with trace.span("process"):
+            result = module.process(image, list(params))
+        if result is None:
+            result = image
+        if not rawimage.imwrite(output_path, result):
+            raise OSError(f"Could not write '{output_path}'")
+        return output_path
+
+def timed_run_script(script_path, input_path, output_path, params):
+    """run_script() returning (output_path, seconds spent in the worker)."""
+    started = time.perf_counter()
+    run_script(script_path, input_path, output_path, params)
+    return output_path, time.perf_counter() - started
+
+class ScriptPool:
+    """A lazily started pool of spawn-based worker processes."""
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        # The executor each submitted future runs on, so cancelling a stale one leaves a newer pool alone.
+        self._owners = weakref.WeakKeyDictionary()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def warm(self, script_paths):
+        """Imports the given scripts ahead of the first run."""
+        executor = self._get_executor()
+        for path in script_paths:
+            for _ in range(self.workers):
+                executor.submit(warm_script, os.path.abspath(path))
+
+    def submit(self, script_path, input_path, output_path, params, timed=False):
+        """Runs the script in a worker. With timed, the future's result is (output_path, seconds)."""
+        func = timed_run_script if timed else run_script
+        args = (os.path.abspath(script_path), os.path.abspath(input_path), os.path.abspath(output_path), list(params))
+        try:
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. a crash inside OpenCV); start a fresh pool.
+            with self._lock:
+                self._executor = None
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+        self._owners[future] = executor
+        return future
+
+    def cancel(self, future):
+        """Cancels a run; one that already started is stopped by killing the workers.
+
+        The pool then starts afresh on the next submit, and the other runs that
+        were in progress or queued fail with BrokenProcessPool.
+        """
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            executor = self._owners.get(future)
+            if executor is None or executor is not self._executor:
+                return
+            self._executor = None
+        # ProcessPoolExecutor has no public way to stop a running call.
+        processes = getattr(executor, "_processes", None) or {}
+        for process in list(processes.values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,83 +1,189 @@
-#/user/bin/env python3
+#!/usr/bin/env python3
+"""Hotkey daemon that captures the screen and saves a blurred copy.
+
+The hotkey callback only grabs the screen and queues the frame, so a press is
+never held up by the previous capture's OCR. Frames are processed by worker
+threads that share the warmed-up OCR and detector state, and the results are
+encoded and written on a separate writer thread. Presses closer together than
+--coalesce seconds are treated as one.
+"""
+import argparse
 import cv2
-import pytesseract
-import re
+import os
+import queue
+import sys
+import threading
+import time
 import numpy as np
 import pyautogui
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pynput import keyboard
 
-def blur_region(image, x, y, w, h, kernel_size, sigma):
-    roi = image[y:y+h, x:x+w]
-    blurred_roi = cv2.GaussianBlur(roi, (kernel_size, kernel_size), sigma)
-    image[y:y+h, x:x+w] = blurred_roi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import encode, ocr, preprocess, redact, trace
+from common.detect import Detector
+from common.layout import LineIndex
+
+HOTKEY = "<ctrl>+<shift>+h"
+QUEUE_SIZE = 8
+COALESCE_SECONDS = 0.3
 
-def auto_blur(image, kernel_size, sigma):
-    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+detector = Detector()
+ocr_options = preprocess.load_options("keyboard-shortcut")
+
+def auto_blur(image, kernel_size, sigma, style="blur"):
+    # Captures are never seen twice, so skip the OCR cache (and keep their text off the disk).
+    data = preprocess.image_to_data(image, ocr_options, use_cache=False)
     texts = data["text"]
     lefts = data["left"]
     tops = data["top"]
     widths = data["width"]
     heights = data["height"]
     print(f"Detected {len([t for t in texts if t.strip()])} non-empty text regions.")
-    
-    sensitive_labels = ["password", "api key", "secret", "token", "pwd", "pass", "credential", "key"]
-    sensitive_patterns = [
-        re.compile(r'[a-fA-F0-9]{32,}'),
-        re.compile(r'[A-Za-z0-9-_]{20,}'),
-        re.compile(r'eyJ[A-Za-z0-9-_]+\.eyJ[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+'),
-        re.compile(r'[A-Za-z0-9+/]{20,}=*'),
-    ]
-    
-    sensitive_boxes = []
-    for i in range(len(texts)):
-        text = texts[i].strip()
-        if not text:
-            continue
-        lower_text = text.lower()
-        if any(label in lower_text for label in sensitive_labels):
-            print(f"Found potential sensitive label in text: '{texts[i]}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-            for j in range(i + 1, len(texts)):
-                if abs(tops[j] - tops[i]) < 10 and texts[j].strip():
+    index = LineIndex(data)
+
+    with trace.span("match"):
+        sensitive_boxes = []
+        for i in range(len(texts)):
+            text = texts[i].strip()
+            if not text:
+                continue
+            match = detector.detect(text)
+            if match is None:
+                continue
+            kind, rule = match
+            if kind == "label":
+                print(f"Found potential sensitive label '{rule}' in text: '{texts[i]}'")
+                sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
+                for j in index.values_right_of(i, 1):
                     print(f"Blurring subsequent text as sensitive value: '{texts[j]}'")
                     sensitive_boxes.append((lefts[j], tops[j], widths[j], heights[j]))
-                    break
-        elif any(pattern.search(text) for pattern in sensitive_patterns):
-            print(f"Found potential standalone secret: '{text}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-    
+            else:
+                print(f"Found potential standalone secret ({rule}): '{text}'")
+                sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
+
     print(f"Number of sensitive boxes detected: {len(sensitive_boxes)}")
-    for box in sensitive_boxes:
-        x, y, w, h = box
-        blur_region(image, x, y, w, h, kernel_size, sigma)
+    redact.blur_boxes(image, sensitive_boxes, kernel_size, sigma, style=style)
     return image
 
-def capture_and_process(kernel_size, sigma):
-    print("Hotkey pressed! Capturing screenshot...")
-    screenshot = pyautogui.screenshot()
-    image = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-    
-    processed_image = auto_blur(image, kernel_size, sigma)
-    
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = f"screenshot_blurred_{timestamp}.png"
-    cv2.imwrite(output_path, processed_image)
-    print(f"Processed screenshot saved as '{output_path}'.")
-
-def on_activate():
-    kernel_size = 99
-    sigma = 30.0
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-    capture_and_process(kernel_size, sigma)
-
-hotkeys = keyboard.GlobalHotKeys({
-    '<ctrl>+<shift>+h': on_activate
-})
-
-print("Press CTRL+SHIFT+H to capture and process a screenshot.")
-print("Press CTRL+C to exit.")
-
-hotkeys.start()
-hotkeys.join()
+def warm_up():
+    """Loads the OCR backend and runs Tesseract once so the first real capture does not pay for it."""
+    started = time.perf_counter()
+    blank = np.full((64, 256, 3), 255, dtype=np.uint8)
+    cv2.putText(blank, "warm up", (8, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    ocr.image_to_data(blank, use_cache=False)
+    print(f"OCR warmed up in {time.perf_counter() - started:.2f} s.")
+
+class HotkeyDaemon:
+    def __init__(self, kernel_size=99, sigma=30.0, workers=1, queue_size=QUEUE_SIZE,
+                 coalesce=COALESCE_SECONDS, output_dir=".", style="blur"):
+        self.kernel_size = kernel_size + 1 if kernel_size % 2 == 0 else kernel_size
+        self.sigma = sigma
+        self.style = style
+        self.coalesce = coalesce
+        self.output_dir = output_dir
+        self.captures = queue.Queue(maxsize=queue_size)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smartscreenshot-writer")
+        self.last_press = 0.0
+        self.workers = [threading.Thread(target=self.work, name=f"smartscreenshot-worker-{n}", daemon=True)
+                        for n in range(max(1, workers))]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def on_activate(self):
+        """Hotkey callback: grab now, process later."""
+        pressed = time.monotonic()
+        if pressed - self.last_press < self.coalesce:
+            print("Repeated hotkey press ignored.")
+            return
+        self.last_press = pressed
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        with trace.span("capture"):
+            screenshot = pyautogui.screenshot()
+            image = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+        grabbed = time.monotonic()
+        try:
+            self.captures.put_nowait((image, timestamp, pressed, grabbed))
+        except queue.Full:
+            print(f"Capture queue is full ({self.captures.maxsize} pending); dropping this capture.")
+            return
+        print(f"Captured in {1000 * (grabbed - pressed):.0f} ms, {self.captures.qsize()} queued.")
+
+    def work(self):
+        while True:
+            item = self.captures.get()
+            if item is None:
+                self.captures.task_done()
+                return
+            image, timestamp, pressed, grabbed = item
+            started = time.monotonic()
+            try:
+                processed_image = auto_blur(image, self.kernel_size, self.sigma, self.style)
+                output_path = os.path.join(self.output_dir,
+                                           f"screenshot_blurred_{timestamp}{encode.extension('final')}")
+                future = self.writer.submit(self.write, processed_image, output_path, pressed, grabbed, started)
+                future.add_done_callback(self.report_write_error)
+            except Exception as e:
+                print("Processing capture failed:", e)
+            finally:
+                self.captures.task_done()
+
+    def write(self, image, output_path, pressed, grabbed, started):
+        if not encode.imwrite(output_path, image, "final"):
+            print(f"Error: Could not save '{output_path}'.")
+            return
+        done = time.monotonic()
+        print(f"Processed screenshot saved as '{output_path}' (grab {1000 * (grabbed - pressed):.0f} ms, "
+              f"queued {1000 * (started - grabbed):.0f} ms, total {1000 * (done - pressed):.0f} ms).")
+
+    def report_write_error(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            print("Saving capture failed:", future.exception())
+
+    def shutdown(self):
+        """Finishes the queued captures and pending writes."""
+        for _ in self.workers:
+            self.captures.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.writer.shutdown(wait=True)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Capture and blur a screenshot on a global hotkey.")
+    parser.add_argument("--hotkey", default=HOTKEY, help=f"pynput hotkey (default: {HOTKEY})")
+    parser.add_argument("--kernel-size", type=int, default=99)
+    parser.add_argument("--sigma", type=float, default=30.0)
+    parser.add_argument("--style", choices=redact.STYLES, default="blur", help="how secrets are hidden")
+    parser.add_argument("--workers", type=int, default=1, help="captures processed in parallel")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="captures that can wait for a worker")
+    parser.add_argument("--coalesce", type=float, default=COALESCE_SECONDS,
+                        help="presses closer together than this many seconds count once")
+    parser.add_argument("--output-dir", default=".", help="where blurred screenshots are saved")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    os.makedirs(args.output_dir, exist_ok=True)
+    daemon = HotkeyDaemon(args.kernel_size, args.sigma, args.workers, args.queue_size,
+                          args.coalesce, args.output_dir, args.style)
+    warm_up()
+    daemon.start()
+
+    hotkeys = keyboard.GlobalHotKeys({args.hotkey: daemon.on_activate})
+    print(f"Press {args.hotkey.upper()} to capture and process a screenshot.")
+    print("Press CTRL+C to exit.")
+    hotkeys.start()
+    try:
+        hotkeys.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hotkeys.stop()
+        print("Finishing queued captures...")
+        daemon.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,78 @@
 #!/usr/bin/env python3
-import cv2
-import pytesseract
-import re
 import os
 import sys
 
-def blur_region(image, x, y, w, h, kernel_size, sigma):
-    roi = image[y:y+h, x:x+w]
-    blurred_roi = cv2.GaussianBlur(roi, (kernel_size, kernel_size), sigma)
-    image[y:y+h, x:x+w] = blurred_roi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import preprocess, rawimage, redact, regions, trace
+from common.detect import Detector, compile_literals
+from common.layout import LineIndex
 
-def auto_blur(image, kernel_size, sigma):
-    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+detector = Detector()
+ocr_options = preprocess.load_options("secrets-handling-custom-keywords")
+
+@trace.traced("match")
+def find_sensitive_boxes(data, value_tokens=1):
     texts = data["text"]
     lefts = data["left"]
     tops = data["top"]
     widths = data["width"]
     heights = data["height"]
     print(f"Detected {len([t for t in texts if t.strip()])} non-empty text regions.")
+    index = LineIndex(data)
 
-    sensitive_labels = ["password", "api key", "secret", "token", "pwd", "pass", "credential", "key"]
-
-    sensitive_patterns = [
-        re.compile(r'[a-fA-F0-9]{32,}'),
-        re.compile(r'[A-Za-z0-9-_]{20,}'),
-        re.compile(r'eyJ[A-Za-z0-9-_]+\.eyJ[A-Za-z0-9-_]+\.[A-Za-z0-9-_]+'),
-        re.compile(r'[A-Za-z0-9+/]{20,}=*'),
-    ]
-
-    sensitive_boxes = []
+    found = []
     for i in range(len(texts)):
         text = texts[i].strip()
         if not text:
             continue
-        lower_text = text.lower()
-        if any(label in lower_text for label in sensitive_labels):
-            print(f"Found potential sensitive label in text: '{texts[i]}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-            for j in range(i + 1, len(texts)):
-                if abs(tops[j] - tops[i]) < 10 and texts[j].strip():
-                    print(f"Blurring subsequent text as sensitive value: '{texts[j]}'")
-                    sensitive_boxes.append((lefts[j], tops[j], widths[j], heights[j]))
-                    break
-        elif any(pattern.search(text) for pattern in sensitive_patterns):
-            print(f"Found potential standalone secret: '{text}'")
-            sensitive_boxes.append((lefts[i], tops[i], widths[i], heights[i]))
-
-    print(f"Number of sensitive boxes detected: {len(sensitive_boxes)}")
-    for box in sensitive_boxes:
-        x, y, w, h = box
-        blur_region(image, x, y, w, h, kernel_size, sigma)
-    return image
-
-def manual_blur_by_keywords(image, kernel_size, sigma, keywords):
+        match = detector.detect(text)
+        if match is None:
+            continue
+        kind, rule = match
+        if kind == "label":
+            print(f"Found potential sensitive label '{rule}' in text: '{texts[i]}'")
+            found.append(regions.region((lefts[i], tops[i], widths[i], heights[i]), "label", rule))
+            for j in index.values_right_of(i, value_tokens):
+                print(f"Blurring subsequent text as sensitive value: '{texts[j]}'")
+                found.append(regions.region((lefts[j], tops[j], widths[j], heights[j]), "value", rule))
+        else:
+            print(f"Found potential standalone secret ({rule}): '{text}'")
+            found.append(regions.region((lefts[i], tops[i], widths[i], heights[i]), "secret", rule))
+
+    print(f"Number of sensitive boxes detected: {len(found)}")
+    return found
+
+@trace.traced("match_keywords")
+def find_keyword_boxes(data, keywords):
     keywords = [kw.strip().lower() for kw in keywords if kw.strip()]
-    if not keywords:
-        return image
+    matcher = compile_literals(keywords)
+    if matcher is None:
+        return []
 
-    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
     texts = data["text"]
     lefts = data["left"]
     tops = data["top"]
     widths = data["width"]
     heights = data["height"]
 
-    for keyword in keywords:
-        count = 0
-        for i, text in enumerate(texts):
-            if keyword in text.lower():
-                blur_region(image, lefts[i], tops[i], widths[i], heights[i], kernel_size, sigma)
-                count += 1
-        print(f"Blurred {count} regions containing '{keyword}'.")
-    return image
-
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: {} <input_image> <output_image> [kernel_size] [sigma] [keywords]".format(sys.argv[0]))
-        sys.exit(1)
-
-    image_path = sys.argv[1]
-    output_path = sys.argv[2]
+    found = []
+    counts = dict.fromkeys(keywords, 0)
+    for i, text in enumerate(texts):
+        m = matcher.search(text.lower())
+        if m:
+            found.append(regions.region((lefts[i], tops[i], widths[i], heights[i]), "keyword", m.group(0)))
+            counts[m.group(0)] += 1
+    for keyword, count in counts.items():
+        print(f"Found {count} regions containing '{keyword}'.")
+    return found
+
+def parse_params(params):
     try:
-        kernel_size = int(sys.argv[3]) if len(sys.argv) > 3 else 99
+        kernel_size = int(params[0]) if len(params) > 0 else 99
     except:
         kernel_size = 99
     try:
-        sigma = float(sys.argv[4]) if len(sys.argv) > 4 else 30
+        sigma = float(params[1]) if len(params) > 1 else 30
     except:
         sigma = 30
 
@@ -95,27 +82,61 @@ def main():
 
     # Optional keywords parameter as a comma-separated string.
     keywords = []
-    if len(sys.argv) > 5:
-        keywords_str = sys.argv[5]
+    if len(params) > 2:
+        keywords_str = params[2]
         if keywords_str.strip():
             keywords = keywords_str.split(',')
+    try:
+        value_tokens = int(params[3]) if len(params) > 3 else 1
+    except:
+        value_tokens = 1
+    style = redact.parse_style(params[4]) if len(params) > 4 and params[4].strip() else "blur"
+    return kernel_size, sigma, keywords, value_tokens, style
 
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Error: Could not read the image file '{image_path}'")
-        sys.exit(1)
-    print("Image loaded successfully.")
+def find_regions(image, keywords, value_tokens):
+    # OCR once and share the result between both passes.
+    data = preprocess.image_to_data(image, ocr_options)
 
-    # Apply automatic blurring.
-    auto_blur(image, kernel_size, sigma)
+    # Automatic detection.
+    found = find_sensitive_boxes(data, value_tokens)
 
-    # Apply manual blurring based on provided keywords.
+    # Manual detection based on provided keywords.
     if keywords:
-        manual_blur_by_keywords(image, kernel_size, sigma, keywords)
+        found += find_keyword_boxes(data, keywords)
     else:
         print("No manual keywords provided; skipping manual blur.")
+    return found
+
+def process(image, params):
+    kernel_size, sigma, keywords, value_tokens, style = parse_params(params)
+
+    # Only the detection settings are in the key, so changing the blur settings or style just re-renders.
+    keyword_key = ",".join(sorted({kw.strip().lower() for kw in keywords if kw.strip()}))
+    key = regions.detection_key(image, "secrets-handling-custom-keywords", detector, ocr_options,
+                                keyword_key, value_tokens)
+    found = regions.cached_regions(key, lambda: find_regions(image, keywords, value_tokens))
+
+    # Redact everything in one pass so overlapping hits are only redacted once.
+    redact.blur_boxes(image, regions.boxes(found), kernel_size, sigma, style=style)
+    return image
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: {} <input_image> <output_image> [kernel_size] [sigma] [keywords] [value_tokens] [blur|pixelate|fill]".format(sys.argv[0]))
+        sys.exit(1)
+
+    image_path = sys.argv[1]
+    output_path = sys.argv[2]
+
+    image = rawimage.imread(image_path)
+    if image is None:
+        print(f"Error: Could not read the image file '{image_path}'")
+        sys.exit(1)
+    print("Image loaded successfully.")
+
+    process(image, sys.argv[3:])
 
-    cv2.imwrite(output_path, image)
+    rawimage.imwrite(output_path, image)
     print(f"Processed image saved as '{output_path}'.")
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""Continuously captures the screen and blurs secrets in every frame.
+
+Running Tesseract on every full frame is far too slow for a live stream, so
+each frame is diffed against the previous one on a grid of tiles. Only the
+changed tiles (grown by a margin, and to the left over any sensitive box
+already known on the same rows, so a label stays next to its value however
+far right the value is) are OCRed again; boxes found earlier in static areas are kept as
+they are, and so are their blurred pixels. A full-frame pass runs on the
+first frame, when most of the screen changed, and every --refresh seconds.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import encode, ocr, redact, trace
+from common.detect import Detector
+from common.layout import LineIndex
+
+TILE_SIZE = 128
+# Per-pixel grey level difference that counts as a change.
+DIFF_THRESHOLD = 16
+# Changed pixels a tile needs before it is re-OCRed; a text caret is a few dozen.
+MIN_CHANGED_PIXELS = 4
+# Padding around changed tiles, and extra room on the left for a label in front of a changed value.
+REGION_MARGIN = 16
+LABEL_CONTEXT = 320
+# Above this fraction of changed tiles the whole frame is OCRed instead.
+FULL_FRAME_FRACTION = 0.5
+REFRESH_SECONDS = 10.0
+VIDEO_EXTENSIONS = (".avi", ".mp4", ".mkv")
+
+detector = Detector()
+
+def intersects(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+def find_sensitive_boxes(data, value_tokens=1, offset=(0, 0)):
+    """Boxes of labels, their values and standalone secrets, shifted by offset."""
+    texts, lefts, tops = data["text"], data["left"], data["top"]
+    widths, heights = data["width"], data["height"]
+    index = LineIndex(data)
+    found = set()
+    for i, text in enumerate(texts):
+        match = detector.detect(text.strip()) if text.strip() else None
+        if match is None:
+            continue
+        found.add(i)
+        if match[0] == "label":
+            found.update(index.values_right_of(i, value_tokens))
+    dx, dy = offset
+    return [(lefts[i] + dx, tops[i] + dy, widths[i], heights[i]) for i in sorted(found)]
+
+def changed_tiles(gray, previous, tile_size=TILE_SIZE, threshold=DIFF_THRESHOLD, min_pixels=MIN_CHANGED_PIXELS):
+    """Boolean (rows, cols) grid of tiles with at least min_pixels changed pixels."""
+    diff = cv2.absdiff(gray, previous) > threshold
+    height, width = diff.shape
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=np.uint16)
+    padded[:height, :width] = diff
+    counts = padded.reshape(rows, tile_size, cols, tile_size).sum(axis=(1, 3))
+    return counts >= min_pixels
+
+def tile_regions(mask, tile_size, width, height, margin=REGION_MARGIN, context=LABEL_CONTEXT):
+    """Pixel rectangles around each connected group of changed tiles."""
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    regions = []
+    for x, y, w, h, _ in stats[1:count]:
+        x1 = max(0, x * tile_size - margin - context)
+        y1 = max(0, y * tile_size - margin)
+        x2 = min(width, (x + w) * tile_size + margin)
+        y2 = min(height, (y + h) * tile_size + margin)
+        regions.append((x1, y1, x2 - x1, y2 - y1))
+    return redact.merge_boxes(regions)
+
+class IncrementalRedactor:
+    """Keeps the sensitive boxes of a stream of frames up to date, OCRing only what changed."""
+
+    def __init__(self, value_tokens=1, tile_size=TILE_SIZE, threshold=DIFF_THRESHOLD,
+                 min_pixels=MIN_CHANGED_PIXELS, refresh=REFRESH_SECONDS, ocr_config=""):
+        self.value_tokens = value_tokens
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.refresh = refresh
+        self.ocr_config = ocr_config
+        self.previous = None
+        self.boxes = []
+        self.last_full = 0.0
+
+    def with_row_boxes(self, region):
+        """Grows a region left over the known boxes on its rows, such as the label of a value being typed."""
+        x, y, w, h = region
+        left = min((b[0] for b in self.boxes if b[0] < x and b[1] < y + h and y < b[1] + b[3]), default=x)
+        if left < x:
+            left = max(0, left - REGION_MARGIN)
+        return left, y, x + w - left, h
+
+    def ocr_boxes(self, image, region):
+        x, y, w, h = region
+        # Frames are never seen twice, so skip the OCR cache (and keep frame text off the disk).
+        data = ocr.image_to_data(image[y:y+h, x:x+w], self.ocr_config, use_cache=False)
+        return find_sensitive_boxes(data, self.value_tokens, (x, y))
+
+    def update(self, frame):
+        """Returns (boxes, changed regions) for the frame; a full-frame pass reports one region."""
+        height, width = frame.shape[:2]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        now = time.monotonic()
+        full = (self.previous is None or self.previous.shape != gray.shape or
+                (self.refresh > 0 and now - self.last_full >= self.refresh))
+        if not full:
+            mask = changed_tiles(gray, self.previous, self.tile_size, self.threshold, self.min_pixels)
+            full = mask.mean() > FULL_FRAME_FRACTION
+        self.previous = gray
+
+        if full:
+            self.last_full = now
+            self.boxes = self.ocr_boxes(frame, (0, 0, width, height))
+            return self.boxes, [(0, 0, width, height)]
+        if not mask.any():
+            return self.boxes, []
+
+        regions = [self.with_row_boxes(r) for r in tile_regions(mask, self.tile_size, width, height)]
+        # A word cut by a region edge would be OCRed in pieces; grow regions over the boxes they touch.
+        touched = [box for box in self.boxes if any(intersects(box, r) for r in regions)]
+        regions = redact.merge_boxes(regions + touched)
+        kept = [box for box in self.boxes if not any(intersects(box, r) for r in regions)]
+        for region in regions:
+            kept += self.ocr_boxes(frame, region)
+        self.boxes = kept
+        return self.boxes, regions
+
+class Renderer:
+    """Redacts merged boxes, copying the redacted pixels of boxes that did not change from the last frame."""
+
+    def __init__(self, kernel_size, sigma, style="blur"):
+        self.kernel_size = kernel_size
+        self.sigma = sigma
+        self.style = style
+        self.previous = None
+        self.previous_boxes = set()
+
+    def render(self, frame, boxes, regions):
+        height, width = frame.shape[:2]
+        merged = redact.merge_boxes([redact.expand_box(*box, 2, width, height) for box in boxes], gap=2)
+        reuse = self.previous is not None and self.previous.shape == frame.shape
+        for x, y, w, h in merged:
+            box = (x, y, w, h)
+            if reuse and box in self.previous_boxes and not any(intersects(box, r) for r in regions):
+                frame[y:y+h, x:x+w] = self.previous[y:y+h, x:x+w]
+            else:
+                frame[y:y+h, x:x+w] = redact.styled(frame[y:y+h, x:x+w], self.style, self.kernel_size, self.sigma)
+        self.previous = frame
+        self.previous_boxes = set(merged)
+        return frame
+
+class PyAutoGUISource:
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def grab(self):
+        return cv2.cvtColor(np.array(self.pyautogui.screenshot()), cv2.COLOR_RGB2BGR)
+
+class GdkSource:
+    """Reads the X11 root window the way the GTK app's full-screen capture does."""
+
+    def __init__(self):
+        import gi
+        gi.require_version("Gdk", "3.0")
+        from gi.repository import Gdk
+        self.Gdk = Gdk
+        self.root = Gdk.get_default_root_window()
+
+    def grab(self):
+        width, height = self.root.get_width(), self.root.get_height()
+        pb = self.Gdk.pixbuf_get_from_window(self.root, 0, 0, width, height)
+        if pb is None:
+            raise RuntimeError("Could not read the root window. Are you on X11?")
+        channels, stride = pb.get_n_channels(), pb.get_rowstride()
+        data = pb.read_pixel_bytes().get_data()
+        rows = np.frombuffer(data + b"\0" * (height * stride - len(data)), dtype=np.uint8).reshape(height, stride)
+        pixels = rows[:, :width * channels].reshape(height, width, channels)
+        return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR if channels == 4 else cv2.COLOR_RGB2BGR)
+
+class FrameSink:
+    """Writes frames to a video file, or as numbered images to a directory."""
+
+    def __init__(self, output, fps):
+        self.output = output
+        self.fps = fps
+        self.writer = None
+        self.count = 0
+        if not output.lower().endswith(VIDEO_EXTENSIONS):
+            os.makedirs(output, exist_ok=True)
+
+    def write(self, frame):
+        self.count += 1
+        if not self.output.lower().endswith(VIDEO_EXTENSIONS):
+            # Frames are written at the fast temp setting to keep up with the stream.
+            path = os.path.join(self.output, f"frame-{self.count:06d}{encode.extension('temp')}")
+            encode.imwrite(path, frame, "temp", verbose=False)
+            return
+        if self.writer is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*("mp4v" if self.output.lower().endswith(".mp4") else "MJPG"))
+            self.writer = cv2.VideoWriter(self.output, fourcc, self.fps, (width, height))
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Capture the screen continuously and blur secrets in each frame.")
+    parser.add_argument("output", help="video file (.avi, .mp4, .mkv) or a directory for numbered frames")
+    parser.add_argument("--source", choices=("pyautogui", "gdk"), default="pyautogui", help="how frames are grabbed")
+    parser.add_argument("--fps", type=float, default=5.0, help="target frame rate (default: 5)")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds (default: Ctrl-C)")
+    parser.add_argument("--kernel-size", type=int, default=99)
+    parser.add_argument("--sigma", type=float, default=30)
+    parser.add_argument("--style", choices=redact.STYLES, default="blur", help="how secrets are hidden")
+    parser.add_argument("--value-tokens", type=int, default=1, help="words after a label to blur")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--refresh", type=float, default=REFRESH_SECONDS,
+                        help="seconds between full-frame OCR passes, 0 for only when needed")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    kernel_size = args.kernel_size + 1 if args.kernel_size % 2 == 0 else args.kernel_size
+    source = GdkSource() if args.source == "gdk" else PyAutoGUISource()
+    redactor = IncrementalRedactor(args.value_tokens, args.tile_size, refresh=args.refresh)
+    renderer = Renderer(kernel_size, args.sigma, args.style)
+    sink = FrameSink(args.output, args.fps)
+
+    interval = 1.0 / args.fps if args.fps > 0 else 0
+    started = time.monotonic()
+    frames = 0
+    ocr_time = 0.0
+    ocr_pixels = 0
+    report_at = started + 1
+    print(f"Streaming to '{args.output}'. Press Ctrl-C to stop.")
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            frame_start = time.monotonic()
+            with trace.span("capture"):
+                frame = source.grab()
+            with trace.span("frame") as details:
+                boxes, regions = redactor.update(frame)
+                details["regions"] = len(regions)
+            ocr_time += time.monotonic() - frame_start
+            ocr_pixels += sum(w * h for _, _, w, h in regions)
+            sink.write(renderer.render(frame, boxes, regions))
+            frames += 1
+
+            now = time.monotonic()
+            if now >= report_at:
+                elapsed = now - started
+                area = frame.shape[0] * frame.shape[1] * frames
+                print(f"{frames / elapsed:.1f} fps, {len(boxes)} boxes, "
+                      f"{1000 * ocr_time / frames:.0f} ms/frame capture+OCR, "
+                      f"{100 * ocr_pixels / area:.1f}% of pixels OCRed")
+                report_at = now + 1
+            delay = interval - (now - frame_start)
+            if delay > 0:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    print(f"Wrote {frames} frames to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()